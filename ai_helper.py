@@ -1,26 +1,398 @@
-from google import genai
-from google.genai import types
 import os
 from dotenv import load_dotenv
-import json
-import re
+import asyncio
+import contextvars
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cache import SingleFlight, TieredCache, make_key, normalize_content
+from chunker import estimate_tokens, split_into_chunks
+from item_bank import add_items, banked_questions, draw_items, normalize_text
+from json_stream import iter_json_array
+from latency_profiles import generation_settings, resolve_profile
+from metrics import record_latency
+from prompt_budget import fit_to_budget, input_budget, prepare_content
+from scheduler import RequestScheduler
 
 # Load environment variables
 load_dotenv()
 
-# Get API key
-api_key = os.getenv('GEMINI_API_KEY')
-if not api_key:
-    raise ValueError("GEMINI_API_KEY not found in .env file!")
-
-# Initialize the client
-client = genai.Client(api_key=api_key)
+# The Gemini client (and the google-genai stack behind it) is only loaded on
+# the first model call, so importing this module stays cheap
+_client = None
+_client_lock = threading.Lock()
 
 # Model to use
 MODEL_ID = "gemini-2.5-flash"
 
-def explain_concept(topic, difficulty):
-    """Generate level-appropriate explanation"""
+# Shared cache for model responses (memory LRU + SQLite on disk)
+response_cache = TieredCache(namespace="responses")
+
+# Identical requests already in flight are joined instead of sent again
+inflight = SingleFlight()
+
+# Map-reduce settings for documents that do not fit in a single prompt
+DIRECT_TOKEN_LIMIT = 2000   # roughly the old 8,000-character cut-off
+CHUNK_TOKENS = 2000
+MAP_WORKERS = 4
+# Notes combined per reduce call; every merge takes at least two, so each
+# round at least halves the number of notes
+MERGE_FAN_IN = 4
+
+# At most this many study pack requests are in flight at once
+STUDY_PACK_CONCURRENCY = 3
+
+# Serve quiz questions and flashcards from the item bank before calling the model
+ITEM_BANK_ENABLED = os.getenv('STUDY_BUDDY_ITEM_BANK', '1') != '0'
+
+# Extra requests for the items still missing after dropping invalid ones
+MAX_REPAIR_ROUNDS = 1
+
+OPTION_LETTERS = ['A', 'B', 'C', 'D']
+
+# Structured output: the model is constrained to these shapes, so responses
+# are plain JSON arrays with no fences or prose to scrape
+# Plain dicts, so the SDK's types are not needed until a request is built
+QUIZ_SCHEMA = {
+    'type': 'ARRAY',
+    'items': {
+        'type': 'OBJECT',
+        'properties': {
+            'question': {'type': 'STRING'},
+            'options': {
+                'type': 'OBJECT',
+                'properties': {letter: {'type': 'STRING'} for letter in OPTION_LETTERS},
+                'required': OPTION_LETTERS,
+                'property_ordering': OPTION_LETTERS,
+            },
+            'correct_answer': {'type': 'STRING', 'enum': OPTION_LETTERS},
+            'explanation': {'type': 'STRING'},
+        },
+        'required': ['question', 'options', 'correct_answer', 'explanation'],
+        # Question first, so streamed items can be shown as soon as they close
+        'property_ordering': ['question', 'options', 'correct_answer', 'explanation'],
+    },
+}
+FLASHCARD_SCHEMA = {
+    'type': 'ARRAY',
+    'items': {
+        'type': 'OBJECT',
+        'properties': {
+            'front': {'type': 'STRING'},
+            'back': {'type': 'STRING'},
+        },
+        'required': ['front', 'back'],
+        'property_ordering': ['front', 'back'],
+    },
+}
+RESPONSE_SCHEMAS = {
+    'generate_quiz': QUIZ_SCHEMA,
+    'generate_flashcards': FLASHCARD_SCHEMA,
+}
+
+# Every model call goes through one scheduler: rate limit sized to our quota,
+# jittered retries, circuit breaker and interactive-before-background ordering
+request_scheduler = RequestScheduler(
+    requests_per_minute=int(os.getenv('STUDY_BUDDY_RPM', 60)),
+    burst=int(os.getenv('STUDY_BUDDY_BURST', 10))
+)
+
+def get_client():
+    """Create the Gemini client on first use and reuse it afterwards
+
+    Raises ValueError if GEMINI_API_KEY is not set.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            from google import genai
+            
+            api_key = os.getenv('GEMINI_API_KEY')
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY not found in .env file!")
+            _client = genai.Client(api_key=api_key)
+    return _client
+
+def _cache_key(function_name, difficulty, count, content, profile=None):
+    """Content-addressed cache key for one generator request
+
+    The latency profile is part of the key: a Quality answer is not served
+    for a Fast request or the other way round.
+    """
+    return make_key(MODEL_ID, resolve_profile(profile), function_name, difficulty, count,
+                    normalize_content(content))
+
+def _cached_generate(function_name, difficulty, count, content, generate, profile=None):
+    """Return a cached result for this request, or generate and store it"""
+    start = time.perf_counter()
+    profile = resolve_profile(profile)
+    key = _cache_key(function_name, difficulty, count, content, profile)
+    cached = response_cache.get(key)
+    if cached is not None:
+        record_latency(function_name, time.perf_counter() - start, cached=True, profile=profile)
+        return cached
+    
+    def produce():
+        result = generate()
+        # Never cache empty results so a failed parse can be retried
+        if result:
+            response_cache.set(key, result)
+        return result
+    
+    # Concurrent callers with the same key share one model call
+    result = inflight.do(key, produce)
+    record_latency(function_name, time.perf_counter() - start, profile=profile)
+    return result
+
+def _cached_stream(function_name, difficulty, count, content, stream, profile=None):
+    """Yield a cached result in one piece, or stream a new one and store it"""
+    start = time.perf_counter()
+    profile = resolve_profile(profile)
+    key = _cache_key(function_name, difficulty, count, content, profile)
+    cached = response_cache.get(key)
+    if cached is not None:
+        elapsed = time.perf_counter() - start
+        record_latency(function_name, elapsed, first_token=elapsed, cached=True, profile=profile)
+        yield cached
+        return
+    
+    # Join an identical request that is already streaming for someone else
+    future, leader = inflight.claim(key)
+    if not leader:
+        shared = future.result()
+        if shared:
+            elapsed = time.perf_counter() - start
+            record_latency(function_name, elapsed, first_token=elapsed, cached=True, profile=profile)
+            yield shared
+            return
+        # The leader was abandoned before finishing, so stream our own copy
+    
+    parts = []
+    first_token = None
+    result = None
+    try:
+        for text in stream():
+            if first_token is None:
+                first_token = time.perf_counter() - start
+            parts.append(text)
+            yield text
+        record_latency(function_name, time.perf_counter() - start, first_token=first_token,
+                       profile=profile)
+        
+        result = "".join(parts)
+        if result:
+            response_cache.set(key, result)
+    except Exception as e:
+        if leader:
+            inflight.resolve(key, future, error=e)
+            leader = False
+        raise
+    finally:
+        if leader:
+            inflight.resolve(key, future, result)
+
+class GenerationStream:
+    """A streamed generation that records whether it failed
+
+    Iterate it once (e.g. with st.write_stream). An error ends the stream:
+    text streams yield "<error_prefix>: <message>" as their last chunk,
+    item streams just stop. Afterwards ``failed`` tells a complete result
+    from a partial one, so partial output is never stored.
+    """
+    
+    def __init__(self, chunks, error_prefix, yield_error=True):
+        self._chunks = chunks
+        self._error_prefix = error_prefix
+        self._yield_error = yield_error
+        self.error = None
+    
+    def __iter__(self):
+        try:
+            yield from self._chunks
+        except Exception as e:
+            self.error = str(e)
+            if self._yield_error:
+                yield f"{self._error_prefix}: {self.error}"
+            else:
+                print(f"{self._error_prefix}: {self.error}")
+    
+    @property
+    def failed(self):
+        return self.error is not None
+
+def _generation_config(function_name, difficulty=None, profile=None):
+    """Thinking budget, output cap and temperature from the latency profile,
+    plus a JSON response schema where one applies"""
+    from google.genai import types
+    
+    settings = generation_settings(function_name, difficulty, profile)
+    config = {
+        'max_output_tokens': settings['max_output_tokens'],
+        'temperature': settings['temperature'],
+        'thinking_config': types.ThinkingConfig(thinking_budget=settings['thinking_budget']),
+    }
+    schema = RESPONSE_SCHEMAS.get(function_name)
+    if schema is not None:
+        config['response_mime_type'] = "application/json"
+        config['response_schema'] = schema
+    return types.GenerateContentConfig(**config)
+
+def _generate_text(prompt, function_name, difficulty=None, profile=None):
+    """Send a single prompt to the model and return the response text"""
+    client = get_client()
+    response = request_scheduler.call(
+        lambda: client.models.generate_content(
+            model=MODEL_ID,
+            contents=prompt,
+            config=_generation_config(function_name, difficulty, profile)
+        )
+    )
+    return response.text
+
+async def _generate_text_async(prompt, function_name, difficulty=None, profile=None):
+    """Async version of _generate_text using the client's aio interface"""
+    client = get_client()
+    response = await request_scheduler.call_async(
+        lambda: client.aio.models.generate_content(
+            model=MODEL_ID,
+            contents=prompt,
+            config=_generation_config(function_name, difficulty, profile)
+        )
+    )
+    return response.text
+
+async def _cached_generate_async(function_name, difficulty, count, content, generate, profile=None):
+    """Async version of _cached_generate; ``generate`` is a coroutine function"""
+    start = time.perf_counter()
+    profile = resolve_profile(profile)
+    key = _cache_key(function_name, difficulty, count, content, profile)
+    cached = response_cache.get(key)
+    if cached is not None:
+        record_latency(function_name, time.perf_counter() - start, cached=True, profile=profile)
+        return cached
+    
+    async def produce():
+        result = await generate()
+        if result:
+            response_cache.set(key, result)
+        return result
+    
+    result = await inflight.do_async(key, produce)
+    record_latency(function_name, time.perf_counter() - start, profile=profile)
+    return result
+
+def _stream_text(prompt, function_name, difficulty=None, profile=None):
+    """Stream a prompt to the model, yielding text as it arrives"""
+    client = get_client()
+    
+    def open_stream():
+        # The request is only sent when the first chunk is pulled, so retry up to there
+        stream = iter(client.models.generate_content_stream(
+            model=MODEL_ID,
+            contents=prompt,
+            config=_generation_config(function_name, difficulty, profile)
+        ))
+        return next(stream, None), stream
+    
+    first, stream = request_scheduler.call(open_stream)
+    if first is None:
+        return
+    for chunk in itertools.chain([first], stream):
+        if chunk.text:
+            yield chunk.text
+
+def _parse_json_array(text):
+    """Parse the JSON array in a model response, keeping every well-formed item"""
+    items = list(iter_json_array([text]))
+    if not items:
+        print(f"Could not find JSON in response: {text[:200]}")
+    return items
+
+def _summarize_chunk(chunk):
+    """Map step: condense one section of a long document into dense notes"""
+    prompt = f"""The following is one section of a longer document.
+
+Write dense study notes for this section that keep every important concept, definition, fact, formula and example.
+Do not add an introduction or conclusion.
+
+Section:
+{chunk}"""
+    # Difficulty-neutral, so the notes are reused at every level
+    return _cached_generate(
+        "summarize_chunk", None, None, chunk,
+        lambda: _generate_text(prompt, "summarize_chunk")
+    )
+
+def _merge_notes(notes, target_tokens):
+    """Reduce step: merge several sets of notes into one set of about ``target_tokens``"""
+    joined = "\n\n".join(notes)
+    # Roughly 3/4 of a word per token
+    target_words = max(50, target_tokens * 3 // 4)
+    prompt = f"""Merge the following study notes from consecutive sections of a document into one set of notes.
+
+Remove repetition, keep every distinct important concept, and keep the original order.
+The merged notes must be at most {target_words} words; shorten wording rather than dropping concepts.
+
+Notes:
+{joined}"""
+    return _cached_generate(
+        "merge_notes", None, target_tokens, joined,
+        lambda: _generate_text(prompt, "merge_notes")
+    )
+
+def _merge_groups(notes):
+    """Consecutive groups of MERGE_FAN_IN notes, none of them a single note"""
+    groups = [notes[i:i + MERGE_FAN_IN] for i in range(0, len(notes), MERGE_FAN_IN)]
+    if len(groups) > 1 and len(groups[-1]) == 1:
+        groups[-2].extend(groups.pop())
+    return groups
+
+def _map_in_context(pool, fn, items):
+    """pool.map, but each call runs in a copy of the caller's context
+
+    Executor threads don't inherit contextvars, so without this a prefetch's
+    map and merge calls would lose its BACKGROUND priority.
+    """
+    futures = [pool.submit(contextvars.copy_context().run, fn, item) for item in items]
+    return [future.result() for future in futures]
+
+def _condense_content(content, max_tokens=DIRECT_TOKEN_LIMIT):
+    """Map-reduce long content into notes that fit in a single prompt"""
+    if estimate_tokens(content) <= max_tokens:
+        return content
+    
+    chunks = split_into_chunks(content, CHUNK_TOKENS)
+    with ThreadPoolExecutor(max_workers=MAP_WORKERS) as pool:
+        notes = _map_in_context(pool, _summarize_chunk, chunks)
+        
+        # Merge rounds until the notes fit in one prompt. Every group holds at
+        # least two notes, so the count shrinks each round and this terminates.
+        while len(notes) > 1 and estimate_tokens("\n\n".join(notes)) > max_tokens:
+            groups = _merge_groups(notes)
+            target_tokens = max_tokens // len(groups)
+            notes = _map_in_context(pool, lambda group: _merge_notes(group, target_tokens), groups)
+    
+    condensed = "\n\n".join(notes)
+    condensed_tokens = estimate_tokens(condensed)
+    if condensed_tokens > max_tokens:
+        print(f"Condensed notes are {condensed_tokens} tokens, over the {max_tokens} token budget; "
+              f"the end of the notes will be trimmed")
+    return condensed
+
+def get_cache_stats():
+    """Return hit/miss counters for the response cache, plus coalesced calls"""
+    stats = response_cache.stats()
+    stats['coalesced'] = inflight.stats()['coalesced']
+    return stats
+
+def get_scheduler_stats():
+    """Return call/retry counters and limiter state for the request scheduler"""
+    return request_scheduler.stats()
+
+def _explain_prompt(topic, difficulty, context=None):
+    """Build the explanation prompt for a topic, optionally grounded in excerpts"""
     
     difficulty_prompts = {
         "Easy": "Explain this topic in very simple terms, as if teaching a beginner or high school student. Use everyday examples and avoid technical jargon.",
@@ -28,10 +400,15 @@ def explain_concept(topic, difficulty):
         "Advanced": "Provide a comprehensive, detailed explanation suitable for advanced students or professionals. Include technical terminology, nuances, and advanced concepts."
     }
     
-    prompt = f"""{difficulty_prompts[difficulty]}
+    topic, _ = prepare_content("explain_concept", topic)
+    if context:
+        # Excerpts share the budget with the topic
+        context = fit_to_budget(context, max(0, input_budget("explain_concept") - estimate_tokens(topic)))
+    
+    return f"""{difficulty_prompts[difficulty]}
 
 Topic: {topic}
-
+{_excerpt_block(context)}
 Provide a clear, structured explanation with:
 1. A brief introduction
 2. Main concepts broken down into digestible points
@@ -39,18 +416,22 @@ Provide a clear, structured explanation with:
 4. A concise summary
 
 Keep the explanation focused and educational."""
-    
-    try:
-        response = client.models.generate_content(
-            model=MODEL_ID,
-            contents=prompt
-        )
-        return response.text
-    except Exception as e:
-        return f"Error generating explanation: {str(e)}"
 
-def summarize_content(content, difficulty):
-    """Summarize text content based on difficulty level"""
+def _excerpt_block(context):
+    """Prompt section with retrieved excerpts from the student's material"""
+    if not context:
+        return ""
+    return f"""
+Base the explanation on these excerpts from the study material:
+{context}
+"""
+
+def _grounded(topic, context):
+    """Cache identity of a topic together with its retrieved context"""
+    return f"{topic}\n\n{context}" if context else topic
+
+def _summary_prompt(content, difficulty):
+    """Build the summary prompt, condensing long content first"""
     
     length_guide = {
         "Easy": "brief (3-5 bullet points)",
@@ -58,28 +439,93 @@ def summarize_content(content, difficulty):
         "Advanced": "comprehensive (8-10 detailed points)"
     }
     
-    prompt = f"""Summarize the following content at a {difficulty.lower()} level.
+    # Long documents are condensed with map-reduce instead of truncated
+    notes, _ = prepare_content("summarize_content", content, condense=_condense_content)
+    
+    return f"""Summarize the following content at a {difficulty.lower()} level.
     
 Create a {length_guide[difficulty]} summary that captures the essential information.
 
 Content:
-{content[:8000]}
+{notes}
 
 Provide the summary in a clear, organized format."""
+
+def _key_points_prompt(content, difficulty):
+    """Build the key points prompt, condensing long content first"""
+    
+    num_points = {
+        "Easy": "5-7",
+        "Intermediate": "7-10",
+        "Advanced": "10-15"
+    }
+    
+    # Long documents are condensed with map-reduce instead of truncated
+    notes, _ = prepare_content("extract_key_points", content, condense=_condense_content)
     
+    return f"""Extract {num_points[difficulty]} key points from this content.
+
+Content:
+{notes}
+
+Format as a numbered list of the most important concepts, facts, or takeaways.
+Make them concise but informative for {difficulty.lower()} level understanding."""
+
+def explain_concept(topic, difficulty, context=None, profile=None):
+    """Generate level-appropriate explanation
+
+    ``context`` holds retrieved excerpts to ground the explanation in.
+    """
     try:
-        response = client.models.generate_content(
-            model=MODEL_ID,
-            contents=prompt
+        return _cached_generate(
+            "explain_concept", difficulty, None, _grounded(topic, context),
+            lambda: _generate_text(_explain_prompt(topic, difficulty, context), "explain_concept",
+                                   difficulty, profile),
+            profile=profile
+        )
+    except Exception as e:
+        return f"Error generating explanation: {str(e)}"
+
+def explain_concept_stream(topic, difficulty, context=None, profile=None):
+    """Stream a level-appropriate explanation as it is generated (a GenerationStream)"""
+    return GenerationStream(
+        _cached_stream(
+            "explain_concept", difficulty, None, _grounded(topic, context),
+            lambda: _stream_text(_explain_prompt(topic, difficulty, context), "explain_concept",
+                                 difficulty, profile),
+            profile=profile
+        ),
+        "Error generating explanation"
+    )
+
+def summarize_content(content, difficulty, profile=None):
+    """Summarize text content based on difficulty level"""
+    try:
+        return _cached_generate(
+            "summarize_content", difficulty, None, content,
+            lambda: _generate_text(_summary_prompt(content, difficulty), "summarize_content",
+                                   difficulty, profile),
+            profile=profile
         )
-        return response.text
     except Exception as e:
         return f"Error generating summary: {str(e)}"
 
-def generate_quiz(topic, difficulty, num_questions=5):
-    """Generate quiz questions"""
-    
-    prompt = f"""Create {num_questions} multiple-choice questions about: {topic}
+def summarize_content_stream(content, difficulty, profile=None):
+    """Stream a summary as it is generated (a GenerationStream)"""
+    return GenerationStream(
+        _cached_stream(
+            "summarize_content", difficulty, None, content,
+            lambda: _stream_text(_summary_prompt(content, difficulty), "summarize_content",
+                                 difficulty, profile),
+            profile=profile
+        ),
+        "Error generating summary"
+    )
+
+def _quiz_prompt(topic, difficulty, num_questions, avoid=None):
+    """Build the multiple-choice quiz prompt, steering away from ``avoid`` questions"""
+    topic, _ = prepare_content("generate_quiz", topic, condense=_condense_content)
+    return f"""Create {num_questions} multiple-choice questions about: {topic}
 
 Difficulty level: {difficulty}
 
@@ -89,57 +535,13 @@ For each question, provide:
 3. The correct answer (letter only)
 4. A brief explanation of why that answer is correct
 
-Format your response as a JSON array with this structure:
-[
-  {{
-    "question": "Question text here?",
-    "options": {{
-      "A": "Option A text",
-      "B": "Option B text",
-      "C": "Option C text",
-      "D": "Option D text"
-    }},
-    "correct_answer": "B",
-    "explanation": "Explanation here"
-  }}
-]
-
 Make questions challenging but fair for the {difficulty.lower()} level.
-IMPORTANT: Return ONLY the JSON array, no other text."""
-    
-    try:
-        response = client.models.generate_content(
-            model=MODEL_ID,
-            contents=prompt
-        )
-        text = response.text
-        
-        # Clean the response text
-        text = text.strip()
-        if text.startswith('```json'):
-            text = text[7:]
-        if text.startswith('```'):
-            text = text[3:]
-        if text.endswith('```'):
-            text = text[:-3]
-        text = text.strip()
-        
-        # Extract JSON from response
-        json_match = re.search(r'\[.*\]', text, re.DOTALL)
-        if json_match:
-            questions = json.loads(json_match.group())
-            return questions
-        else:
-            print(f"Could not find JSON in response: {text[:200]}")
-            return []
-    except Exception as e:
-        print(f"Error generating quiz: {str(e)}")
-        return []
+{_avoid_block(avoid)}"""
 
-def generate_flashcards(topic, difficulty, num_cards=5):
-    """Generate flashcards"""
-    
-    prompt = f"""Create {num_cards} flashcards about: {topic}
+def _flashcard_prompt(topic, difficulty, num_cards, avoid=None):
+    """Build the flashcard prompt, steering away from ``avoid`` cards"""
+    topic, _ = prepare_content("generate_flashcards", topic, condense=_condense_content)
+    return f"""Create {num_cards} flashcards about: {topic}
 
 Difficulty level: {difficulty}
 
@@ -147,68 +549,501 @@ Each flashcard should have:
 1. A clear, focused question or term on the front
 2. A concise but complete answer on the back
 
-Format as JSON:
-[
-  {{
-    "front": "Question or term",
-    "back": "Answer or definition"
-  }}
-]
-
 Make them helpful for {difficulty.lower()} level study.
-IMPORTANT: Return ONLY the JSON array, no other text."""
+{_avoid_block(avoid)}"""
+
+def _bank_draw(kind, content, difficulty, count, variant):
+    """Banked items for a request; variant n draws the n-th slice of the bank"""
+    if not ITEM_BANK_ENABLED:
+        return []
+    try:
+        return draw_items(kind, content, difficulty, count, offset=variant * count)
+    except Exception as e:
+        print(f"Error reading item bank: {str(e)}")
+        return []
+
+def _bank_avoid(kind, content, difficulty):
+    """Banked questions the model should not repeat"""
+    if not ITEM_BANK_ENABLED:
+        return []
+    try:
+        return banked_questions(kind, content, difficulty)
+    except Exception as e:
+        print(f"Error reading item bank: {str(e)}")
+        return []
+
+def _bank_add(kind, content, difficulty, items):
+    """Keep newly generated items for later quizzes, dropping near-duplicates"""
+    if not ITEM_BANK_ENABLED or not items:
+        return
+    try:
+        add_items(kind, content, difficulty, items)
+    except Exception as e:
+        print(f"Error saving to item bank: {str(e)}")
+
+def _avoid_block(avoid):
+    """Prompt section listing questions that already exist"""
+    if not avoid:
+        return ""
+    listed = "\n".join(f"- {question}" for question in avoid)
+    return f"""
+Do not repeat or rephrase any of these existing questions:
+{listed}
+"""
+
+def _with_bank(kind, content, difficulty, count, variant, generate):
+    """Take what the bank has, and call ``generate(n, avoid)`` only for the shortfall"""
+    banked = _bank_draw(kind, content, difficulty, count, variant)
+    shortfall = count - len(banked)
+    if shortfall <= 0:
+        return banked
+    
+    new_items = generate(shortfall, _bank_avoid(kind, content, difficulty))[:shortfall]
+    _bank_add(kind, content, difficulty, new_items)
+    return banked + new_items
+
+def _item_text(item):
+    return item.get('question') or item.get('front')
+
+def _clean_items(raw_items, clean, received=()):
+    """Yield each item that is valid or can be repaired, skipping the rest
+
+    Items repeating one in ``received`` (or an earlier one) are skipped too.
+    """
+    seen = {normalize_text(_item_text(item)) for item in received}
+    for raw in raw_items:
+        item = clean(raw)
+        if item is None:
+            print(f"Skipping invalid item: {str(raw)[:200]}")
+            continue
+        text = normalize_text(_item_text(item))
+        if text in seen:
+            continue
+        seen.add(text)
+        yield item
+
+def _iter_items(count, avoid, fetch, clean):
+    """Yield up to ``count`` clean items from ``fetch(n, avoid)``
+
+    Items that can't be repaired are dropped, and up to MAX_REPAIR_ROUNDS
+    follow-up requests ask for just the ones still missing, listing the
+    questions already received so they are not repeated.
+    """
+    received = []
+    for _ in range(1 + MAX_REPAIR_ROUNDS):
+        round_avoid = list(avoid or []) + [_item_text(item) for item in received]
+        for item in _clean_items(fetch(count - len(received), round_avoid), clean, received):
+            received.append(item)
+            yield item
+            if len(received) >= count:
+                return
+
+def is_valid_question(item):
+    """Check a quiz item has a question, four options and a matching answer"""
+    if not isinstance(item, dict):
+        return False
+    options = item.get('options')
+    return (
+        isinstance(item.get('question'), str)
+        and isinstance(options, dict)
+        and sorted(options) == ['A', 'B', 'C', 'D']
+        and all(isinstance(v, str) for v in options.values())
+        and item.get('correct_answer') in options
+        and isinstance(item.get('explanation'), str)
+    )
+
+def is_valid_flashcard(item):
+    """Check a flashcard has text on both sides"""
+    return (
+        isinstance(item, dict)
+        and isinstance(item.get('front'), str)
+        and isinstance(item.get('back'), str)
+    )
+
+def clean_question(item):
+    """Repair the usual slips in a quiz item, or return None if it is unusable
+
+    Fixes options given as a list, answers like "b" or "B) ..." or the full
+    option text, and a missing explanation.
+    """
+    if not isinstance(item, dict):
+        return None
+    item = dict(item)
     
+    options = item.get('options')
+    if isinstance(options, list) and len(options) == len(OPTION_LETTERS):
+        options = dict(zip(OPTION_LETTERS, options))
+    if isinstance(options, dict):
+        options = {str(k).strip().upper().rstrip(').'): v for k, v in options.items()}
+        item['options'] = options
+    
+    answer = item.get('correct_answer')
+    if isinstance(answer, str) and isinstance(options, dict):
+        answer = answer.strip()
+        if answer not in options:
+            letter = answer[:1].upper()
+            if letter in options and (len(answer) == 1 or answer[1] in ').: '):
+                answer = letter
+            else:
+                # The model sometimes answers with the option text itself
+                matches = [k for k, v in options.items() if isinstance(v, str) and v.strip() == answer]
+                answer = matches[0] if len(matches) == 1 else answer
+        item['correct_answer'] = answer
+    
+    if item.get('explanation') is None:
+        item['explanation'] = ""
+    return item if is_valid_question(item) else None
+
+def clean_flashcard(item):
+    """Repair a flashcard written as question/answer or term/definition, or return None"""
+    if not isinstance(item, dict):
+        return None
+    item = dict(item)
+    item.setdefault('front', item.get('question') or item.get('term'))
+    item.setdefault('back', item.get('answer') or item.get('definition'))
+    if not is_valid_flashcard(item):
+        return None
+    return {'front': item['front'], 'back': item['back']}
+
+def _cached_items(function_name, difficulty, count, content, stream, clean, limit,
+                  bank_kind=None, variant=0, profile=None):
+    """Yield cached items, or parse them out of a stream as each one closes
+
+    With ``bank_kind``, banked items are yielded first and
+    ``stream(shortfall, avoid)`` is only called if the bank runs short.
+    New items are then added to the bank. Streamed items go through
+    ``clean``, and items still missing are requested again.
+    """
+    start = time.perf_counter()
+    profile = resolve_profile(profile)
+    key = _cache_key(function_name, difficulty, count, content, profile)
+    cached = response_cache.get(key)
+    if cached is not None:
+        elapsed = time.perf_counter() - start
+        record_latency(function_name, elapsed, first_token=elapsed, cached=True, profile=profile)
+        yield from cached
+        return
+    
+    # Join an identical request that is already streaming for someone else
+    future, leader = inflight.claim(key)
+    if not leader:
+        shared = future.result()
+        if shared:
+            elapsed = time.perf_counter() - start
+            record_latency(function_name, elapsed, first_token=elapsed, cached=True, profile=profile)
+            yield from shared
+            return
+        # The leader was abandoned before finishing, so stream our own copy
+    
+    items = []
+    first_item = None
+    result = None
     try:
-        response = client.models.generate_content(
-            model=MODEL_ID,
-            contents=prompt
-        )
-        text = response.text
+        banked = _bank_draw(bank_kind, content, difficulty, limit, variant) if bank_kind else []
+        for item in banked:
+            if first_item is None:
+                first_item = time.perf_counter() - start
+            items.append(item)
+            yield item
         
-        # Clean the response text
-        text = text.strip()
-        if text.startswith('```json'):
-            text = text[7:]
-        if text.startswith('```'):
-            text = text[3:]
-        if text.endswith('```'):
-            text = text[:-3]
-        text = text.strip()
+        if len(items) < limit:
+            avoid = _bank_avoid(bank_kind, content, difficulty) if bank_kind else None
+            fetch = lambda n, round_avoid: iter_json_array(stream(n, round_avoid))
+            for item in _iter_items(limit - len(items), avoid, fetch, clean):
+                if first_item is None:
+                    first_item = time.perf_counter() - start
+                items.append(item)
+                yield item
+            if bank_kind:
+                _bank_add(bank_kind, content, difficulty, items[len(banked):])
+        record_latency(function_name, time.perf_counter() - start, first_token=first_item,
+                       profile=profile)
         
-        # Extract JSON from response
-        json_match = re.search(r'\[.*\]', text, re.DOTALL)
-        if json_match:
-            flashcards = json.loads(json_match.group())
-            return flashcards
-        else:
-            print(f"Could not find JSON in response: {text[:200]}")
-            return []
+        result = items
+        if items:
+            response_cache.set(key, items)
+    except Exception as e:
+        if leader:
+            inflight.resolve(key, future, error=e)
+            leader = False
+        raise
+    finally:
+        if leader:
+            inflight.resolve(key, future, result)
+
+def generate_quiz(topic, difficulty, num_questions=5, variant=0, profile=None):
+    """Generate quiz questions
+
+    ``variant`` is part of the cache key, so bumping it requests a fresh set
+    of questions for the same topic instead of the cached one.
+    """
+    def fetch(n, avoid):
+        return _parse_json_array(_generate_text(_quiz_prompt(topic, difficulty, n, avoid), "generate_quiz",
+                                                difficulty, profile))
+    
+    def generate_missing(n, avoid):
+        return list(_iter_items(n, avoid, fetch, clean_question))
+    
+    try:
+        return _cached_generate(
+            "generate_quiz", difficulty, (num_questions, variant), topic,
+            lambda: _with_bank('quiz', topic, difficulty, num_questions, variant, generate_missing),
+            profile=profile
+        )
+    except Exception as e:
+        print(f"Error generating quiz: {str(e)}")
+        return []
+
+def generate_quiz_stream(topic, difficulty, num_questions=5, variant=0, profile=None):
+    """Stream validated quiz questions one at a time as the model writes them (a GenerationStream)"""
+    return GenerationStream(
+        _cached_items(
+            "generate_quiz", difficulty, (num_questions, variant), topic,
+            lambda n, avoid: _stream_text(_quiz_prompt(topic, difficulty, n, avoid), "generate_quiz",
+                                          difficulty, profile),
+            clean_question, num_questions,
+            bank_kind='quiz', variant=variant, profile=profile
+        ),
+        "Error generating quiz", yield_error=False
+    )
+
+def generate_flashcards(topic, difficulty, num_cards=5, variant=0, profile=None):
+    """Generate flashcards
+
+    ``variant`` is part of the cache key, so bumping it requests a fresh deck.
+    """
+    def fetch(n, avoid):
+        return _parse_json_array(_generate_text(_flashcard_prompt(topic, difficulty, n, avoid), "generate_flashcards",
+                                                difficulty, profile))
+    
+    def generate_missing(n, avoid):
+        return list(_iter_items(n, avoid, fetch, clean_flashcard))
+    
+    try:
+        return _cached_generate(
+            "generate_flashcards", difficulty, (num_cards, variant), topic,
+            lambda: _with_bank('flashcard', topic, difficulty, num_cards, variant, generate_missing),
+            profile=profile
+        )
     except Exception as e:
         print(f"Error generating flashcards: {str(e)}")
         return []
 
-def extract_key_points(content, difficulty):
+def generate_flashcards_stream(topic, difficulty, num_cards=5, variant=0, profile=None):
+    """Stream validated flashcards one at a time as the model writes them (a GenerationStream)"""
+    return GenerationStream(
+        _cached_items(
+            "generate_flashcards", difficulty, (num_cards, variant), topic,
+            lambda n, avoid: _stream_text(_flashcard_prompt(topic, difficulty, n, avoid), "generate_flashcards",
+                                          difficulty, profile),
+            clean_flashcard, num_cards,
+            bank_kind='flashcard', variant=variant, profile=profile
+        ),
+        "Error generating flashcards", yield_error=False
+    )
+
+def extract_key_points(content, difficulty, profile=None):
     """Extract key points from content"""
+    try:
+        return _cached_generate(
+            "extract_key_points", difficulty, None, content,
+            lambda: _generate_text(_key_points_prompt(content, difficulty), "extract_key_points",
+                                   difficulty, profile),
+            profile=profile
+        )
+    except Exception as e:
+        return f"Error extracting key points: {str(e)}"
+
+def extract_key_points_stream(content, difficulty, profile=None):
+    """Stream key points as they are generated (a GenerationStream)"""
+    return GenerationStream(
+        _cached_stream(
+            "extract_key_points", difficulty, None, content,
+            lambda: _stream_text(_key_points_prompt(content, difficulty), "extract_key_points",
+                                 difficulty, profile),
+            profile=profile
+        ),
+        "Error extracting key points"
+    )
+
+async def explain_concept_async(topic, difficulty, context=None, profile=None):
+    """Async version of explain_concept"""
+    try:
+        return await _cached_generate_async(
+            "explain_concept", difficulty, None, _grounded(topic, context),
+            lambda: _generate_text_async(_explain_prompt(topic, difficulty, context), "explain_concept",
+                                         difficulty, profile),
+            profile=profile
+        )
+    except Exception as e:
+        return f"Error generating explanation: {str(e)}"
+
+async def summarize_content_async(content, difficulty, profile=None):
+    """Async version of summarize_content"""
+    async def generate():
+        # Map-reduce of long documents runs on its own thread pool
+        prompt = await asyncio.to_thread(_summary_prompt, content, difficulty)
+        return await _generate_text_async(prompt, "summarize_content", difficulty, profile)
     
-    num_points = {
-        "Easy": "5-7",
-        "Intermediate": "7-10",
-        "Advanced": "10-15"
-    }
+    try:
+        return await _cached_generate_async("summarize_content", difficulty, None, content, generate,
+                                            profile=profile)
+    except Exception as e:
+        return f"Error generating summary: {str(e)}"
+
+async def extract_key_points_async(content, difficulty, profile=None):
+    """Async version of extract_key_points"""
+    async def generate():
+        prompt = await asyncio.to_thread(_key_points_prompt, content, difficulty)
+        return await _generate_text_async(prompt, "extract_key_points", difficulty, profile)
     
-    prompt = f"""Extract {num_points[difficulty]} key points from this content.
+    try:
+        return await _cached_generate_async("extract_key_points", difficulty, None, content, generate,
+                                            profile=profile)
+    except Exception as e:
+        return f"Error extracting key points: {str(e)}"
 
-Content:
-{content[:8000]}
+async def _collect_items_async(count, avoid, build_prompt, topic, difficulty, function_name, clean,
+                               profile=None):
+    """Async version of _iter_items for a quiz or flashcard prompt builder"""
+    items = []
+    for _ in range(1 + MAX_REPAIR_ROUNDS):
+        round_avoid = list(avoid or []) + [_item_text(item) for item in items]
+        # Long content is condensed on a thread, as in summarize_content_async
+        prompt = await asyncio.to_thread(build_prompt, topic, difficulty, count - len(items), round_avoid)
+        text = await _generate_text_async(prompt, function_name, difficulty, profile)
+        items.extend(_clean_items(_parse_json_array(text), clean, items))
+        if len(items) >= count:
+            break
+    return items[:count]
 
-Format as a numbered list of the most important concepts, facts, or takeaways.
-Make them concise but informative for {difficulty.lower()} level understanding."""
+async def generate_quiz_async(topic, difficulty, num_questions=5, variant=0, profile=None):
+    """Async version of generate_quiz"""
+    async def generate():
+        banked = await asyncio.to_thread(_bank_draw, 'quiz', topic, difficulty, num_questions, variant)
+        shortfall = num_questions - len(banked)
+        if shortfall <= 0:
+            return banked
+        avoid = await asyncio.to_thread(_bank_avoid, 'quiz', topic, difficulty)
+        questions = await _collect_items_async(
+            shortfall, avoid, _quiz_prompt, topic, difficulty, "generate_quiz", clean_question, profile
+        )
+        await asyncio.to_thread(_bank_add, 'quiz', topic, difficulty, questions)
+        return banked + questions
     
     try:
-        response = client.models.generate_content(
-            model=MODEL_ID,
-            contents=prompt
+        return await _cached_generate_async("generate_quiz", difficulty, (num_questions, variant), topic, generate,
+                                            profile=profile)
+    except Exception as e:
+        print(f"Error generating quiz: {str(e)}")
+        return []
+
+async def generate_flashcards_async(topic, difficulty, num_cards=5, variant=0, profile=None):
+    """Async version of generate_flashcards"""
+    async def generate():
+        banked = await asyncio.to_thread(_bank_draw, 'flashcard', topic, difficulty, num_cards, variant)
+        shortfall = num_cards - len(banked)
+        if shortfall <= 0:
+            return banked
+        avoid = await asyncio.to_thread(_bank_avoid, 'flashcard', topic, difficulty)
+        cards = await _collect_items_async(
+            shortfall, avoid, _flashcard_prompt, topic, difficulty, "generate_flashcards", clean_flashcard,
+            profile
         )
-        return response.text
+        await asyncio.to_thread(_bank_add, 'flashcard', topic, difficulty, cards)
+        return banked + cards
+    
+    try:
+        return await _cached_generate_async("generate_flashcards", difficulty, (num_cards, variant), topic, generate,
+                                            profile=profile)
     except Exception as e:
-        return f"Error extracting key points: {str(e)}"
\ No newline at end of file
+        print(f"Error generating flashcards: {str(e)}")
+        return []
+
+# What each text job returns instead of a result when it fails
+_PACK_ERROR_PREFIXES = {
+    'explanation': "Error generating explanation: ",
+    'summary': "Error generating summary: ",
+    'key_points': "Error extracting key points: ",
+}
+
+def _pack_result_ok(name, result):
+    """False for an empty quiz or deck and for a text job's error message"""
+    if not result:
+        return False
+    prefix = _PACK_ERROR_PREFIXES.get(name)
+    return not (prefix and isinstance(result, str) and result.startswith(prefix))
+
+async def generate_study_pack_async(content, difficulty, num_questions=5, num_cards=5,
+                                    quiz_variant=0, card_variant=0, on_result=None,
+                                    max_concurrency=STUDY_PACK_CONCURRENCY, profile=None):
+    """Generate every artifact for the content concurrently
+
+    Calls ``on_result(name, result)`` as each one finishes and returns a
+    dict of all results keyed by 'explanation', 'summary', 'key_points',
+    'quiz' and 'flashcards'. The quiz and deck are generated for their own
+    round (``quiz_variant`` / ``card_variant``).
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    jobs = {
+        'explanation': lambda: explain_concept_async(content, difficulty, profile=profile),
+        'summary': lambda: summarize_content_async(content, difficulty, profile=profile),
+        'key_points': lambda: extract_key_points_async(content, difficulty, profile=profile),
+        'quiz': lambda: generate_quiz_async(content, difficulty, num_questions, quiz_variant, profile=profile),
+        'flashcards': lambda: generate_flashcards_async(content, difficulty, num_cards, card_variant,
+                                                        profile=profile),
+    }
+    
+    async def run(name, job):
+        async with semaphore:
+            return name, await job()
+    
+    results = {}
+    for finished in asyncio.as_completed([run(name, job) for name, job in jobs.items()]):
+        name, result = await finished
+        results[name] = result
+        if on_result:
+            on_result(name, result)
+    return results
+
+# Long-lived event loop for async work started from synchronous code (Streamlit)
+_background_loop = None
+_loop_lock = threading.Lock()
+
+def _get_background_loop():
+    """Start the background event loop thread on first use"""
+    global _background_loop
+    with _loop_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="ai-helper-loop", daemon=True).start()
+            _background_loop = loop
+    return _background_loop
+
+def iter_study_pack(content, difficulty, num_questions=5, num_cards=5,
+                    quiz_variant=0, card_variant=0, profile=None):
+    """Generate a study pack concurrently, yielding (name, result, ok) as each finishes
+
+    ``ok`` is False when that artifact failed; its result is then an error
+    message or empty and should not be shown or stored. The requests run on
+    a background event loop; results are handed back to the calling thread,
+    so callers can update the UI as they arrive.
+    """
+    results = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(
+        generate_study_pack_async(
+            content, difficulty, num_questions, num_cards, quiz_variant, card_variant,
+            on_result=lambda name, result: results.put((name, result, _pack_result_ok(name, result))),
+            profile=profile
+        ),
+        _get_background_loop()
+    )
+    
+    while True:
+        try:
+            yield results.get(timeout=0.1)
+        except queue.Empty:
+            if future.done() and results.empty():
+                # Surface any unexpected failure of the pack itself
+                future.result()
+                return
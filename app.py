@@ -1,23 +1,40 @@
 import streamlit as st
 import os
-import pandas as pd
+import uuid
 from database import (
     init_db, 
     save_quiz_result, 
-    get_quiz_history, 
-    get_performance_stats,
-    get_performance_by_difficulty,
-    get_score_distribution,
-    get_recent_trend
+    get_dashboard_snapshot,
+    get_data_version,
+    add_review_cards,
+    get_due_cards,
+    grade_cards,
+    get_or_create_user,
+    start_session,
+    DEFAULT_USER_ID
 )
 from ai_helper import (
-    explain_concept, 
-    summarize_content, 
-    generate_quiz, 
-    generate_flashcards,
-    extract_key_points
+    explain_concept_stream, 
+    summarize_content_stream, 
+    generate_quiz_stream, 
+    generate_flashcards_stream,
+    extract_key_points_stream,
+    iter_study_pack,
+    get_cache_stats
 )
-from pdf_processor import extract_text_from_pdf
+from document_store import (
+    open_pdf,
+    get_document,
+    list_documents,
+    save_artifact,
+    get_artifact,
+    index_path
+)
+from item_bank import content_hash
+from latency_profiles import DEFAULT_PROFILE, PROFILES
+from metrics import get_recent_latencies, get_token_savings
+from prefetch import Prefetcher
+from spaced_repetition import GRADE_LABELS
 
 # Page configuration
 st.set_page_config(
@@ -27,7 +44,52 @@ st.set_page_config(
 )
 
 # Initialize database
-init_db()
+@st.cache_resource
+def prepare_database():
+    """Apply pending migrations once per server process, not on every rerun"""
+    init_db()
+
+prepare_database()
+
+def load_dashboard_snapshot(user_id):
+    """Return the user's dashboard data, refreshed only after new results are saved"""
+    version = (get_data_version(), user_id)
+    if st.session_state.get('dashboard_version') != version:
+        st.session_state['dashboard_snapshot'] = get_dashboard_snapshot(user_id)
+        st.session_state['dashboard_version'] = version
+    return st.session_state['dashboard_snapshot']
+
+def store_artifact(document_hash, kind, difficulty, result, variant=0):
+    """Keep a generated result with its document so reopening it is instant"""
+    if not document_hash or not result:
+        return
+    if isinstance(result, str) and result.startswith("Error"):
+        return
+    save_artifact(document_hash, kind, difficulty, result, variant)
+    st.session_state.setdefault('artifacts', {})[(document_hash, kind, difficulty, variant)] = result
+
+def load_artifact(document_hash, kind, difficulty, variant=0):
+    """Return a stored artifact, reading the database once per session"""
+    artifacts = st.session_state.setdefault('artifacts', {})
+    key = (document_hash, kind, difficulty, variant)
+    if key not in artifacts:
+        artifacts[key] = get_artifact(document_hash, kind, difficulty, variant)
+    return artifacts[key]
+
+# Sections of the main area; only the active one is rendered on each run
+SECTIONS = ["📖 Explain", "📝 Summary", "❓ Quiz", "🎴 Flashcards", "🔑 Key Points", "📈 Progress"]
+EXPLAIN, SUMMARY, QUIZ, FLASHCARDS, KEY_POINTS, PROGRESS = SECTIONS
+
+# Spaced-repetition review: cards per session, and grades written per batch
+REVIEW_SESSION_SIZE = 20
+REVIEW_BATCH_SIZE = 10
+
+def flush_review_grades():
+    """Write this session's pending review grades in one batch"""
+    pending = st.session_state.get('review_pending')
+    if pending:
+        grade_cards(pending, user_id=st.session_state.get('user_id', DEFAULT_USER_ID))
+        st.session_state['review_pending'] = []
 
 # Custom CSS
 st.markdown("""
@@ -219,10 +281,36 @@ with st.sidebar:
     # New Chat Button at the top
     st.markdown("### 💬 Session Management")
     
+    # Quiz history, dashboard and reviews are kept per student
+    username = st.text_input(
+        "👤 Student name:",
+        value="local",
+        key="username",
+        help="Your quiz history and review schedule are kept under this name"
+    ).strip() or "local"
+    course = st.text_input(
+        "🎓 Course (optional):",
+        key="course",
+        help="Groups your results with your course's; leave empty to keep the one saved for you"
+    ).strip() or None
+    if st.session_state.get('active_user') != (username, course):
+        flush_review_grades()
+        for key in ('review_queue', 'review_position', 'review_pending', 'review_revealed'):
+            st.session_state.pop(key, None)
+        st.session_state['user_id'] = get_or_create_user(username, course)
+        st.session_state['session_id'] = start_session(st.session_state['user_id'])
+        st.session_state['active_user'] = (username, course)
+    user_id = st.session_state['user_id']
+    
     if st.button(" New Chat", use_container_width=True, type="primary"):
-        # Clear all session state
+        # Stop background work for the old session, then clear all session state
+        if 'prefetcher' in st.session_state:
+            st.session_state['prefetcher'].cancel()
+        flush_review_grades()
         for key in list(st.session_state.keys()):
-            del st.session_state[key]
+            # Stay signed in as the same student, in the same section
+            if key not in ('username', 'course', 'section'):
+                del st.session_state[key]
         st.rerun()
     
     st.markdown("""
@@ -234,7 +322,7 @@ with st.sidebar:
     st.divider()
     
     # Input method
-    input_method = st.radio("📥 Input Method:", ["Text Input", "PDF Upload"])
+    input_method = st.radio("📥 Input Method:", ["Text Input", "PDF Upload", "Saved Documents"])
     
     # Difficulty level
     difficulty = st.selectbox(
@@ -243,32 +331,47 @@ with st.sidebar:
         help="Choose the complexity level for explanations and quizzes"
     )
     
+    # How long the model may think and answer
+    profile = st.selectbox(
+        "⏱️ Response Profile:",
+        list(PROFILES),
+        index=PROFILES.index(DEFAULT_PROFILE),
+        help="Fast skips extended reasoning for quick drills; Quality takes longer for deeper answers"
+    )
+    
+    # Background generation of the next quiz / deck
+    prefetch_enabled = st.toggle(
+        "⚡ Prefetch next quiz & flashcards",
+        value=False,
+        help="Generate the next set in the background while you study, so 'Take Another Quiz' is instant"
+    )
+    
     st.divider()
     
     # Quick Stats Section
     st.markdown("### 📊 Quick Stats")
     
-    stats = get_performance_stats()
-    if stats and stats[0] > 0:
+    snapshot = load_dashboard_snapshot(user_id)
+    if snapshot.total_quizzes > 0:
         # Create compact metric cards
         st.markdown(f"""
         <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 15px; border-radius: 10px; color: white; margin-bottom: 10px;">
             <div style="font-size: 0.75rem; opacity: 0.9;">TOTAL QUIZZES</div>
-            <div style="font-size: 1.8rem; font-weight: bold;">{stats[0]}</div>
+            <div style="font-size: 1.8rem; font-weight: bold;">{snapshot.total_quizzes}</div>
         </div>
         """, unsafe_allow_html=True)
         
         st.markdown(f"""
         <div style="background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%); padding: 15px; border-radius: 10px; color: white; margin-bottom: 10px;">
             <div style="font-size: 0.75rem; opacity: 0.9;">AVERAGE SCORE</div>
-            <div style="font-size: 1.8rem; font-weight: bold;">{stats[1]:.1f}%</div>
+            <div style="font-size: 1.8rem; font-weight: bold;">{snapshot.avg_score:.1f}%</div>
         </div>
         """, unsafe_allow_html=True)
         
         st.markdown(f"""
         <div style="background: linear-gradient(135deg, #11998e 0%, #38ef7d 100%); padding: 15px; border-radius: 10px; color: white; margin-bottom: 10px;">
             <div style="font-size: 0.75rem; opacity: 0.9;">BEST SCORE</div>
-            <div style="font-size: 1.8rem; font-weight: bold;">{stats[2]:.1f}%</div>
+            <div style="font-size: 1.8rem; font-weight: bold;">{snapshot.best_score:.1f}%</div>
         </div>
         """, unsafe_allow_html=True)
     else:
@@ -305,6 +408,19 @@ with st.sidebar:
         </div>
         """, unsafe_allow_html=True)
     
+    # Response cache counters
+    cache_stats = get_cache_stats()
+    st.caption(
+        f"⚡ Response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+        f"({cache_stats['hit_rate']*100:.0f}% hit rate)"
+    )
+    profile_timings = [e['total'] for e in get_recent_latencies(profile=profile) if not e['cached']]
+    if profile_timings:
+        st.caption(f"⏱️ {profile} profile: {sum(profile_timings) / len(profile_timings):.1f}s average response")
+    token_savings = get_token_savings()
+    if token_savings['saved']:
+        st.caption(f"✂️ Prompt budgeting saved ~{token_savings['saved']:,} tokens")
+    
     st.divider()
     
     # Quick Actions
@@ -313,12 +429,12 @@ with st.sidebar:
     col1, col2 = st.columns(2)
     
     with col1:
-        if st.button("📖", help="Go to Explain tab", use_container_width=True):
-            st.info("Switch to 'Explain' tab above!")
+        if st.button("📖", help="Go to Explain", use_container_width=True):
+            st.session_state['section'] = EXPLAIN
     
     with col2:
-        if st.button("❓", help="Go to Quiz tab", use_container_width=True):
-            st.info("Switch to 'Quiz' tab above!")
+        if st.button("❓", help="Go to Quiz", use_container_width=True):
+            st.session_state['section'] = QUIZ
     
     st.divider()
     
@@ -330,7 +446,7 @@ with st.sidebar:
         **Getting Started:**
         1. Enter a topic or upload PDF
         2. Select difficulty level
-        3. Choose a tab (Explain, Quiz, etc.)
+        3. Choose a section (Explain, Quiz, etc.)
         4. Start learning!
         
         **Features:**
@@ -364,6 +480,8 @@ with st.sidebar:
     """, unsafe_allow_html=True)
 
 # Main content area
+# Set when the content is a stored document, so generated results are kept with it
+document_hash = None
 if input_method == "Text Input":
     topic = st.text_area(
         "Enter topic or paste your notes:",
@@ -371,189 +489,494 @@ if input_method == "Text Input":
         placeholder="e.g., Photosynthesis, Newton's Laws, Machine Learning Basics..."
     )
     content = topic
-else:
+elif input_method == "PDF Upload":
     uploaded_file = st.file_uploader("Upload PDF file", type=['pdf'])
     if uploaded_file:
-        with st.spinner("Extracting text from PDF..."):
-            content = extract_text_from_pdf(uploaded_file)
-            st.success(f"✅ Extracted {len(content)} characters from PDF")
-            with st.expander("Preview extracted text"):
+        # Processed once per file across all sessions; reruns reuse this session's copy
+        if st.session_state.get('document_upload') != uploaded_file.file_id:
+            with st.spinner("Extracting text from PDF..."):
+                progress_bar = st.empty()
+                st.session_state['document'] = open_pdf(
+                    uploaded_file.getvalue(),
+                    uploaded_file.name,
+                    progress=lambda done, total: progress_bar.progress(
+                        done / total, text=f"Extracted {done}/{total} pages"
+                    )
+                )
+                progress_bar.empty()
+            st.session_state['document_upload'] = uploaded_file.file_id
+        
+        extraction = st.session_state['document']
+        content = extraction['text']
+        if extraction['page_count'] > 0:
+            document_hash = extraction['file_hash']
+        
+        if extraction['reopened']:
+            st.success(
+                f"📚 Reopened {extraction['name']} from the library "
+                f"({extraction['page_count']} pages, already processed)"
+            )
+        else:
+            st.success(
+                f"✅ Extracted {extraction['char_count']} characters from "
+                f"{extraction['page_count']} pages in {extraction['extraction_time']:.2f}s"
+            )
+        with st.expander("Preview extracted text"):
+            st.text(content[:500] + "..." if len(content) > 500 else content)
+    else:
+        content = None
+else:
+    documents = {d[0]: d for d in list_documents()}
+    if documents:
+        # Options are file hashes and the choice is kept by hash, so new
+        # uploads by other students can't move this selection
+        hashes = list(documents)
+        chosen = st.session_state.get('selected_document')
+        selected = st.selectbox(
+            "Choose a document:",
+            hashes,
+            index=hashes.index(chosen) if chosen in documents else 0,
+            format_func=lambda h: f"{documents[h][1]} ({documents[h][2]} pages)",
+            key="document_choice"
+        )
+        st.session_state['selected_document'] = selected
+        stored = st.session_state.get('document')
+        if not stored or stored['file_hash'] != selected:
+            stored = get_document(selected)
+            st.session_state['document'] = stored
+            st.session_state.pop('document_upload', None)
+        
+        if stored:
+            content = stored['text']
+            document_hash = stored['file_hash']
+            st.success(f"📚 Opened {stored['name']} ({stored['page_count']} pages)")
+            with st.expander("Preview text"):
                 st.text(content[:500] + "..." if len(content) > 500 else content)
+        else:
+            content = None
+            st.error("This document's files are missing. Please upload it again.")
     else:
         content = None
+        st.info("No saved documents yet. Upload a PDF and it will be kept here.")
 
-# Tabs for different features
-tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-    "📖 Explain", "📝 Summary", "❓ Quiz", "🎴 Flashcards", "🔑 Key Points", "📈 Progress"
-])
+# One prefetcher per session; queued work is dropped when the content changes
+if prefetch_enabled:
+    prefetcher = st.session_state.setdefault('prefetcher', Prefetcher())
+    prefetcher.track_content(content, difficulty)
 
-# Tab 1: Explain Concept
-with tab1:
+# Study pack: every artifact for the content at once, generated concurrently
+if st.button("🎒 Generate Study Pack", key="study_pack_btn", help="Explanation, summary, key points, quiz and flashcards in one go"):
+    if content:
+        pack_labels = {
+            'explanation': "Explanation",
+            'summary': "Summary",
+            'key_points': "Key points",
+            'quiz': "Quiz",
+            'flashcards': "Flashcards",
+        }
+        st.session_state['study_pack'] = {}
+        with st.status("Generating study pack...", expanded=True) as pack_status:
+            quiz_round = st.session_state.get('quiz_round', 0)
+            flashcard_round = st.session_state.get('flashcard_round', 0)
+            for name, result, ok in iter_study_pack(
+                content, difficulty,
+                num_questions=st.session_state.get('num_questions', 5),
+                num_cards=st.session_state.get('num_cards', 5),
+                quiz_variant=quiz_round,
+                card_variant=flashcard_round,
+                profile=profile
+            ):
+                if not ok:
+                    # Error messages are neither shown as content nor kept
+                    st.write(f"⚠️ {pack_labels[name]} failed")
+                    continue
+                # Keep the pack with the document so reopening it is instant
+                variant = {'quiz': quiz_round, 'flashcards': flashcard_round}.get(name, 0)
+                store_artifact(document_hash, name, difficulty, result, variant=variant)
+                if name == 'quiz':
+                    st.session_state['quiz_questions'] = result
+                    st.session_state['quiz_answers'] = {}
+                    st.session_state['quiz_submitted'] = False
+                    st.session_state['quiz_attempt_id'] = uuid.uuid4().hex
+                elif name == 'flashcards':
+                    st.session_state['flashcards'] = result
+                    st.session_state['show_answers'] = [False] * len(result)
+                else:
+                    st.session_state['study_pack'][name] = result
+                st.write(f"✅ {pack_labels[name]} ready")
+            pack_status.update(label="Study pack ready! Open the sections below.", state="complete", expanded=False)
+    else:
+        st.warning("Please enter a topic or upload a PDF first!")
+
+study_pack = st.session_state.get('study_pack', {})
+
+# Section navigation. Unlike st.tabs, which runs every tab body on every
+# rerun, only the active section's code runs, so e.g. the dashboard is
+# built only while the Progress section is open.
+section = st.radio(
+    "Section",
+    SECTIONS,
+    key="section",
+    horizontal=True,
+    label_visibility="collapsed"
+)
+
+# Explain Concept
+if section == EXPLAIN:
     st.header("Concept Explanation")
     
+    # For documents, explain one subtopic using only the most relevant passages
+    subtopic = ""
+    if input_method != "Text Input":
+        subtopic = st.text_input(
+            "Focus on a subtopic (optional):",
+            placeholder="e.g., Krebs cycle, Lagrange multipliers...",
+            help="Only the most relevant passages of the document are sent to the AI"
+        )
+    
     if st.button("Generate Explanation", key="explain_btn", type="primary"):
         if content:
             with st.spinner(f"Generating {difficulty.lower()} level explanation..."):
-                explanation = explain_concept(content, difficulty)
-                st.markdown(explanation)
+                if subtopic:
+                    # numpy and the retrieval index load on first use
+                    from retrieval import retrieve_context
+                    
+                    # Stored documents come with a prebuilt retrieval index
+                    try:
+                        excerpts = retrieve_context(
+                            content, subtopic,
+                            index_path=index_path(document_hash) if document_hash else None
+                        )
+                    except Exception as e:
+                        # Explain without excerpts rather than not at all
+                        print(f"Error retrieving excerpts: {str(e)}")
+                        excerpts = None
+                    stream = explain_concept_stream(subtopic, difficulty, context=excerpts, profile=profile)
+                else:
+                    stream = explain_concept_stream(content, difficulty, profile=profile)
+                # Render the explanation progressively as tokens arrive
+                st.write_stream(stream)
         else:
             st.warning("Please enter a topic or upload a PDF first!")
+    elif 'explanation' in study_pack:
+        st.markdown(study_pack['explanation'])
 
-# Tab 2: Summary
-with tab2:
+# Summary
+if section == SUMMARY:
     st.header("Content Summary")
     
     if st.button("Generate Summary", key="summary_btn", type="primary"):
         if content:
             with st.spinner("Creating summary..."):
-                summary = summarize_content(content, difficulty)
-                st.markdown(summary)
+                stream = summarize_content_stream(content, difficulty, profile=profile)
+                summary = st.write_stream(stream)
+            # A stream that broke off holds partial text plus the error; never keep it
+            if not stream.failed:
+                store_artifact(document_hash, 'summary', difficulty, summary)
         else:
             st.warning("Please enter content or upload a PDF first!")
+    elif 'summary' in study_pack:
+        st.markdown(study_pack['summary'])
+    elif document_hash:
+        saved_summary = load_artifact(document_hash, 'summary', difficulty)
+        if saved_summary:
+            st.caption("Saved with this document")
+            st.markdown(saved_summary)
 
-# Tab 3: Quiz
-with tab3:
-    st.header("Test Your Knowledge")
-    
-    num_questions = st.slider("Number of questions:", 3, 10, 5)
-    
-    if st.button("Generate Quiz", key="quiz_btn", type="primary"):
-        if content:
-            with st.spinner("Creating quiz questions..."):
-                questions = generate_quiz(content, difficulty, num_questions)
-                
-                if questions:
-                    st.session_state['quiz_questions'] = questions
-                    st.session_state['quiz_answers'] = {}
-                    st.session_state['quiz_submitted'] = False
-                    st.rerun()
-                else:
-                    st.error("Failed to generate quiz. Please try again.")
-        else:
-            st.warning("Please enter a topic or upload a PDF first!")
+# Quiz
+@st.fragment
+def quiz_panel(content, difficulty, user_id):
+    """Quiz form and results; submitting reruns only this panel"""
+    questions = st.session_state['quiz_questions']
     
-    # Display quiz if generated
-    if 'quiz_questions' in st.session_state and st.session_state['quiz_questions']:
-        questions = st.session_state['quiz_questions']
-        
-        if not st.session_state.get('quiz_submitted', False):
-            # Quiz form
-            with st.form("quiz_form"):
-                for i, q in enumerate(questions):
-                    st.subheader(f"Question {i+1}")
-                    st.write(q['question'])
-                    
-                    answer = st.radio(
-                        "Select your answer:",
-                        options=list(q['options'].keys()),
-                        format_func=lambda x: f"{x}: {q['options'][x]}",
-                        key=f"q_{i}"
-                    )
-                    st.session_state['quiz_answers'][i] = answer
-                
-                submit = st.form_submit_button("Submit Quiz", type="primary")
-                
-                if submit:
-                    st.session_state['quiz_submitted'] = True
-                    st.rerun()
-        
-        else:
-            # Show results
-            score = 0
+    if not st.session_state.get('quiz_submitted', False):
+        # Quiz form
+        with st.form("quiz_form"):
             for i, q in enumerate(questions):
-                user_answer = st.session_state['quiz_answers'].get(i)
-                correct = q['correct_answer']
-                
                 st.subheader(f"Question {i+1}")
                 st.write(q['question'])
                 
-                if user_answer == correct:
-                    score += 1
-                    st.markdown(f'<div class="quiz-option correct">✅ Your answer: {user_answer} - Correct!</div>', unsafe_allow_html=True)
-                else:
-                    st.markdown(f'<div class="quiz-option incorrect">❌ Your answer: {user_answer} - Incorrect</div>', unsafe_allow_html=True)
-                    st.markdown(f'<div class="quiz-option correct">✅ Correct answer: {correct}</div>', unsafe_allow_html=True)
-                
-                st.info(f"💡 {q['explanation']}")
-                st.divider()
+                answer = st.radio(
+                    "Select your answer:",
+                    options=list(q['options'].keys()),
+                    format_func=lambda x: f"{x}: {q['options'][x]}",
+                    key=f"q_{i}"
+                )
+                st.session_state['quiz_answers'][i] = answer
             
-            # Final score
-            percentage = (score / len(questions)) * 100
-            st.success(f"### Final Score: {score}/{len(questions)} ({percentage:.1f}%)")
+            submit = st.form_submit_button("Submit Quiz", type="primary")
             
-            # Save to database
+            if submit:
+                st.session_state['quiz_submitted'] = True
+                st.rerun(scope="fragment")
+    
+    else:
+        # Show results
+        score = 0
+        for i, q in enumerate(questions):
+            user_answer = st.session_state['quiz_answers'].get(i)
+            correct = q['correct_answer']
+            
+            st.subheader(f"Question {i+1}")
+            st.write(q['question'])
+            
+            if user_answer == correct:
+                score += 1
+                st.markdown(f'<div class="quiz-option correct">✅ Your answer: {user_answer} - Correct!</div>', unsafe_allow_html=True)
+            else:
+                st.markdown(f'<div class="quiz-option incorrect">❌ Your answer: {user_answer} - Incorrect</div>', unsafe_allow_html=True)
+                st.markdown(f'<div class="quiz-option correct">✅ Correct answer: {correct}</div>', unsafe_allow_html=True)
+            
+            st.info(f"💡 {q['explanation']}")
+            st.divider()
+        
+        # Final score
+        percentage = (score / len(questions)) * 100
+        st.success(f"### Final Score: {score}/{len(questions)} ({percentage:.1f}%)")
+        
+        # Save to database once per attempt; reruns while the results are on
+        # screen skip the write (the unique attempt ID is the backstop)
+        attempt_id = st.session_state.setdefault('quiz_attempt_id', uuid.uuid4().hex)
+        if st.session_state.get('quiz_saved') != attempt_id:
             save_quiz_result(
                 topic=content[:100] if content else "Quiz",
                 difficulty=difficulty,
                 score=score,
-                total=len(questions)
+                total=len(questions),
+                attempt_id=attempt_id,
+                user_id=user_id,
+                session_id=st.session_state.get('session_id')
             )
+            st.session_state['quiz_saved'] = attempt_id
+        
+        if st.button("Take Another Quiz"):
+            # Ask for a fresh set of questions rather than the cached one
+            st.session_state['quiz_round'] = st.session_state.get('quiz_round', 0) + 1
+            del st.session_state['quiz_questions']
+            del st.session_state['quiz_answers']
+            del st.session_state['quiz_submitted']
+            st.session_state.pop('quiz_attempt_id', None)
+            # The Generate Quiz button lives outside this panel
+            st.rerun()
+
+if section == QUIZ:
+    st.header("Test Your Knowledge")
+    
+    # Widgets in hidden sections lose their state, so the choice is kept separately
+    num_questions = st.slider("Number of questions:", 3, 10, st.session_state.get('num_questions', 5))
+    st.session_state['num_questions'] = num_questions
+    
+    if st.button("Generate Quiz", key="quiz_btn", type="primary"):
+        if content:
+            st.session_state['quiz_questions'] = []
+            st.session_state['quiz_answers'] = {}
+            st.session_state['quiz_submitted'] = False
+            # Stable ID so the result is stored once however often the page reruns
+            st.session_state['quiz_attempt_id'] = uuid.uuid4().hex
             
-            if st.button("Take Another Quiz"):
-                del st.session_state['quiz_questions']
-                del st.session_state['quiz_answers']
-                del st.session_state['quiz_submitted']
+            quiz_round = st.session_state.get('quiz_round', 0)
+            saved_quiz = load_artifact(document_hash, 'quiz', difficulty, quiz_round) if document_hash else None
+            if saved_quiz and len(saved_quiz) == num_questions:
+                st.session_state['quiz_questions'] = saved_quiz
+            else:
+                with st.spinner("Creating quiz questions..."):
+                    # Show each question as soon as the model finishes writing it
+                    stream = generate_quiz_stream(content, difficulty, num_questions, variant=quiz_round, profile=profile)
+                    for q in stream:
+                        st.session_state['quiz_questions'].append(q)
+                        st.subheader(f"Question {len(st.session_state['quiz_questions'])}")
+                        st.write(q['question'])
+                if not stream.failed:
+                    store_artifact(document_hash, 'quiz', difficulty, st.session_state['quiz_questions'], quiz_round)
+            
+            if st.session_state['quiz_questions']:
                 st.rerun()
+            else:
+                del st.session_state['quiz_questions']
+                st.error("Failed to generate quiz. Please try again.")
+        else:
+            st.warning("Please enter a topic or upload a PDF first!")
+    
+    # Display quiz if generated
+    if 'quiz_questions' in st.session_state and st.session_state['quiz_questions']:
+        # Get the next quiz ready while this one is being answered
+        if prefetch_enabled and content:
+            prefetcher.prefetch_quiz(
+                content, difficulty, num_questions,
+                variant=st.session_state.get('quiz_round', 0) + 1,
+                profile=profile
+            )
+        
+        quiz_panel(content, difficulty, user_id)
 
-# Tab 4: Flashcards
-with tab4:
+# Flashcards
+@st.fragment
+def flashcard_deck(content, difficulty, user_id):
+    """Flashcards with Show Answer toggles; flipping a card reruns only the deck"""
+    flashcards = st.session_state['flashcards']
+    
+    for i, card in enumerate(flashcards):
+        with st.container():
+            st.markdown(f'<div class="flashcard">', unsafe_allow_html=True)
+            st.subheader(f"Card {i+1}")
+            st.write(f"**Q:** {card['front']}")
+            
+            if st.button(f"Show Answer", key=f"show_{i}"):
+                st.session_state['show_answers'][i] = not st.session_state['show_answers'][i]
+            
+            if st.session_state['show_answers'][i]:
+                st.write(f"**A:** {card['back']}")
+            
+            st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Keep the deck and review it on a schedule instead of regenerating it
+    if content and st.button("📥 Add Deck to Review Schedule", key="review_add_btn"):
+        added = add_review_cards(
+            content_hash(content), content[:100], difficulty, flashcards, user_id=user_id
+        )
+        st.success(f"Added {added} new cards to your review schedule")
+
+@st.fragment
+def review_session(user_id):
+    """Spaced-repetition review; grading a card reruns only this panel"""
+    if 'review_queue' not in st.session_state:
+        if st.button("Start Review Session", key="review_start_btn"):
+            queue = get_due_cards(REVIEW_SESSION_SIZE, user_id=user_id)
+            if queue:
+                st.session_state['review_queue'] = queue
+                st.session_state['review_position'] = 0
+                st.session_state['review_pending'] = []
+                st.session_state['review_revealed'] = False
+                st.rerun(scope="fragment")
+            else:
+                st.info("No cards are due. Add a deck to your review schedule to get started!")
+    else:
+        queue = st.session_state['review_queue']
+        position = st.session_state['review_position']
+        
+        if position < len(queue):
+            card_id, front, back, card_topic, repetitions = queue[position]
+            st.caption(f"Card {position + 1} of {len(queue)} · {card_topic}")
+            st.write(f"**Q:** {front}")
+            
+            if not st.session_state['review_revealed']:
+                if st.button("Show Answer", key="review_show_btn"):
+                    st.session_state['review_revealed'] = True
+                    st.rerun(scope="fragment")
+            else:
+                st.write(f"**A:** {back}")
+                grade_columns = st.columns(len(GRADE_LABELS))
+                for column, (grade, label) in zip(grade_columns, GRADE_LABELS.items()):
+                    if column.button(label, key=f"review_grade_{grade}", use_container_width=True):
+                        st.session_state['review_pending'].append((card_id, grade))
+                        st.session_state['review_position'] += 1
+                        st.session_state['review_revealed'] = False
+                        if len(st.session_state['review_pending']) >= REVIEW_BATCH_SIZE:
+                            flush_review_grades()
+                        st.rerun(scope="fragment")
+        else:
+            flush_review_grades()
+            st.success(f"🎉 Review session complete! You reviewed {len(queue)} cards.")
+            if st.button("Finish Review", key="review_finish_btn"):
+                for key in ('review_queue', 'review_position', 'review_pending', 'review_revealed'):
+                    st.session_state.pop(key, None)
+                st.rerun(scope="fragment")
+
+if section == FLASHCARDS:
     st.header("Study Flashcards")
     
-    num_cards = st.slider("Number of flashcards:", 3, 10, 5, key="flashcard_slider")
+    num_cards = st.slider("Number of flashcards:", 3, 10, st.session_state.get('num_cards', 5))
+    st.session_state['num_cards'] = num_cards
     
     if st.button("Generate Flashcards", key="flashcard_btn", type="primary"):
         if content:
-            with st.spinner("Creating flashcards..."):
-                flashcards = generate_flashcards(content, difficulty, num_cards)
-                
-                if flashcards:
-                    st.session_state['flashcards'] = flashcards
-                    st.session_state['show_answers'] = [False] * len(flashcards)
-                    st.rerun()
-                else:
-                    st.error("Failed to generate flashcards. Please try again.")
+            # Regenerating while a deck is shown asks for a new deck
+            if 'flashcards' in st.session_state:
+                st.session_state['flashcard_round'] = st.session_state.get('flashcard_round', 0) + 1
+            
+            st.session_state['flashcards'] = []
+            st.session_state['show_answers'] = []
+            
+            flashcard_round = st.session_state.get('flashcard_round', 0)
+            saved_deck = load_artifact(document_hash, 'flashcards', difficulty, flashcard_round) if document_hash else None
+            if saved_deck and len(saved_deck) == num_cards:
+                st.session_state['flashcards'] = saved_deck
+                st.session_state['show_answers'] = [False] * len(saved_deck)
+            else:
+                with st.spinner("Creating flashcards..."):
+                    # Show each card as soon as the model finishes writing it
+                    stream = generate_flashcards_stream(content, difficulty, num_cards, variant=flashcard_round, profile=profile)
+                    for card in stream:
+                        st.session_state['flashcards'].append(card)
+                        st.session_state['show_answers'].append(False)
+                        st.subheader(f"Card {len(st.session_state['flashcards'])}")
+                        st.write(f"**Q:** {card['front']}")
+                if not stream.failed:
+                    store_artifact(document_hash, 'flashcards', difficulty, st.session_state['flashcards'], flashcard_round)
+            
+            if st.session_state['flashcards']:
+                st.rerun()
+            else:
+                del st.session_state['flashcards']
+                del st.session_state['show_answers']
+                st.error("Failed to generate flashcards. Please try again.")
         else:
             st.warning("Please enter a topic or upload a PDF first!")
     
     # Display flashcards
     if 'flashcards' in st.session_state:
-        flashcards = st.session_state['flashcards']
+        # Get the next deck ready while this one is being studied
+        if prefetch_enabled and content:
+            prefetcher.prefetch_flashcards(
+                content, difficulty, num_cards,
+                variant=st.session_state.get('flashcard_round', 0) + 1,
+                profile=profile
+            )
         
-        for i, card in enumerate(flashcards):
-            with st.container():
-                st.markdown(f'<div class="flashcard">', unsafe_allow_html=True)
-                st.subheader(f"Card {i+1}")
-                st.write(f"**Q:** {card['front']}")
-                
-                if st.button(f"Show Answer", key=f"show_{i}"):
-                    st.session_state['show_answers'][i] = not st.session_state['show_answers'][i]
-                
-                if st.session_state['show_answers'][i]:
-                    st.write(f"**A:** {card['back']}")
-                
-                st.markdown('</div>', unsafe_allow_html=True)
+        flashcard_deck(content, difficulty, user_id)
+    
+    st.divider()
+    st.subheader("🔁 Spaced Repetition Review")
+    
+    review_session(user_id)
 
-# Tab 5: Key Points
-with tab5:
+# Key Points
+if section == KEY_POINTS:
     st.header("Key Points")
     
     if st.button("Extract Key Points", key="keypoints_btn", type="primary"):
         if content:
             with st.spinner("Extracting key points..."):
-                key_points = extract_key_points(content, difficulty)
-                st.markdown(key_points)
+                stream = extract_key_points_stream(content, difficulty, profile=profile)
+                key_points = st.write_stream(stream)
+            if not stream.failed:
+                store_artifact(document_hash, 'key_points', difficulty, key_points)
         else:
             st.warning("Please enter content or upload a PDF first!")
+    elif 'key_points' in study_pack:
+        st.markdown(study_pack['key_points'])
+    elif document_hash:
+        saved_key_points = load_artifact(document_hash, 'key_points', difficulty)
+        if saved_key_points:
+            st.caption("Saved with this document")
+            st.markdown(saved_key_points)
 
-# Tab 6: Progress Tracking
-# Tab 6: Progress Tracking - Professional Dashboard
-with tab6:
+# Progress Tracking - Professional Dashboard
+@st.fragment
+def progress_dashboard(user_id):
+    """Performance dashboard, rerun on its own by the Refresh button"""
     st.markdown('<p class="section-header">📊 Learning Performance Dashboard</p>', unsafe_allow_html=True)
     
-    history = get_quiz_history()
-    stats = get_performance_stats()
+    # Picks up quizzes submitted since the dashboard was drawn, without a full rerun
+    st.button("🔄 Refresh", key="dashboard_refresh")
     
-    if history and stats and stats[0] > 0:
+    # One cached snapshot covers every figure in this section
+    snapshot = load_dashboard_snapshot(user_id)
+    history = snapshot.recent_history
+    
+    if snapshot.total_quizzes > 0:
+        # pandas is only needed for the charts, so it stays off the startup path
+        import pandas as pd
         
         # ============== TOP METRICS ROW ==============
         st.markdown("### Key Metrics Overview")
@@ -563,13 +986,13 @@ with tab6:
             st.markdown(f"""
             <div class="metric-card metric-card-purple">
                 <div class="metric-label">Total Quizzes</div>
-                <div class="metric-value">{stats[0]}</div>
+                <div class="metric-value">{snapshot.total_quizzes}</div>
                 <div class="metric-delta">🎯 Keep learning!</div>
             </div>
             """, unsafe_allow_html=True)
         
         with col2:
-            avg_score = stats[1]
+            avg_score = snapshot.avg_score
             delta_symbol = "📈" if avg_score >= 70 else "📊"
             st.markdown(f"""
             <div class="metric-card metric-card-blue">
@@ -583,13 +1006,13 @@ with tab6:
             st.markdown(f"""
             <div class="metric-card metric-card-green">
                 <div class="metric-label">Best Performance</div>
-                <div class="metric-value">{stats[2]:.1f}%</div>
+                <div class="metric-value">{snapshot.best_score:.1f}%</div>
                 <div class="metric-delta">🏆 Personal Best</div>
             </div>
             """, unsafe_allow_html=True)
         
         with col4:
-            improvement = stats[2] - stats[3]
+            improvement = snapshot.best_score - snapshot.lowest_score
             st.markdown(f"""
             <div class="metric-card metric-card-orange">
                 <div class="metric-label">Score Range</div>
@@ -631,9 +1054,11 @@ with tab6:
             st.markdown('<div class="chart-container">', unsafe_allow_html=True)
             st.markdown("#### 🎯 Performance by Difficulty")
             
-            # Calculate averages by difficulty
-            df_by_diff = df_history.groupby('Difficulty')['Percentage'].mean().reset_index()
-            df_by_diff.columns = ['Difficulty', 'Average Score']
+            # Averages by difficulty over all results
+            df_by_diff = pd.DataFrame(
+                [(diff, avg) for diff, avg, _ in snapshot.by_difficulty],
+                columns=['Difficulty', 'Average Score']
+            )
             
             # Create bar chart
             st.bar_chart(
@@ -654,12 +1079,11 @@ with tab6:
         with col1:
             st.markdown('<p class="section-header">🏅 Score Distribution</p>', unsafe_allow_html=True)
             
-            # Calculate score ranges
-            excellent = len([h for h in history if h[4] >= 90])
-            good = len([h for h in history if 70 <= h[4] < 90])
-            needs_improvement = len([h for h in history if h[4] < 70])
+            excellent = snapshot.excellent
+            good = snapshot.good
+            needs_improvement = snapshot.needs_review
             
-            total_quizzes = stats[0]
+            total_quizzes = snapshot.total_quizzes
             
             st.markdown(f"""
             <div class="insight-card insight-card-success">
@@ -827,9 +1251,8 @@ with tab6:
         
         with col3:
             # Recent trend
-            if len(history) >= 3:
-                recent_3 = [h[4] for h in history[:3]]
-                trend_avg = sum(recent_3) / len(recent_3)
+            if snapshot.recent_average is not None:
+                trend_avg = snapshot.recent_average
                 
                 if trend_avg > avg_score:
                     st.markdown(f"""
@@ -889,7 +1312,7 @@ with tab6:
         col1, col2, col3, col4, col5 = st.columns(5)
         
         with col1:
-            total_questions = sum([h[3] for h in history])
+            total_questions = snapshot.total_questions
             st.markdown(f"""
             <div class="insight-card">
                 <div style="text-align: center;">
@@ -901,7 +1324,7 @@ with tab6:
             """, unsafe_allow_html=True)
         
         with col2:
-            total_correct = sum([h[2] for h in history])
+            total_correct = snapshot.total_correct
             st.markdown(f"""
             <div class="insight-card">
                 <div style="text-align: center;">
@@ -926,14 +1349,9 @@ with tab6:
         
         with col4:
             # Most common difficulty
-            difficulty_counts = {}
-            for h in history:
-                diff = h[1]
-                difficulty_counts[diff] = difficulty_counts.get(diff, 0) + 1
-            
-            if difficulty_counts:
-                most_common = max(difficulty_counts, key=difficulty_counts.get)
-                count = difficulty_counts[most_common]
+            if snapshot.most_practiced:
+                most_common = snapshot.most_practiced
+                count = snapshot.most_practiced_count
                 st.markdown(f"""
                 <div class="insight-card">
                     <div style="text-align: center;">
@@ -946,9 +1364,7 @@ with tab6:
         
         with col5:
             # Study streak (quizzes in last 7 days)
-            from datetime import datetime, timedelta
-            week_ago = datetime.now() - timedelta(days=7)
-            recent_quizzes = len([h for h in history if datetime.strptime(h[5], '%Y-%m-%d %H:%M:%S') > week_ago])
+            recent_quizzes = snapshot.quizzes_last_7_days
             
             st.markdown(f"""
             <div class="insight-card">
@@ -1033,6 +1449,10 @@ with tab6:
             <p style="color: #555;">Aim for <strong>70%+ average score</strong> across all difficulty levels to truly master any topic. Consistency is key!</p>
         </div>
         """, unsafe_allow_html=True)
+
+if section == PROGRESS:
+    progress_dashboard(user_id)
+
 # Footer
 st.divider()
 st.markdown("""
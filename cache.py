@@ -0,0 +1,284 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Default location and limits for the response cache
+CACHE_DB_PATH = os.getenv('STUDY_BUDDY_CACHE_DB', 'response_cache.db')
+CACHE_TTL_SECONDS = int(os.getenv('STUDY_BUDDY_CACHE_TTL', 7 * 24 * 3600))
+CACHE_MEMORY_ENTRIES = 256
+CACHE_DISK_BYTES = 200 * 1024 * 1024
+
+
+def normalize_content(text):
+    """Collapse whitespace so trivially different pastes share a cache key"""
+    if text is None:
+        return ""
+    return " ".join(str(text).split())
+
+
+def make_key(*parts):
+    """Build a content-addressed key from the given parts"""
+    payload = json.dumps(parts, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TieredCache:
+    """Two-tier cache: in-process LRU in front of a SQLite table on disk.
+
+    Values must be JSON-serializable. Entries older than ``ttl`` seconds are
+    treated as missing, and the disk tier is trimmed (least recently used
+    first) once it grows past ``max_disk_bytes``. Pass ``db_path=None`` for a
+    memory-only cache.
+    """
+
+    def __init__(self, namespace, db_path=CACHE_DB_PATH, ttl=CACHE_TTL_SECONDS,
+                 memory_entries=CACHE_MEMORY_ENTRIES, max_disk_bytes=CACHE_DISK_BYTES):
+        self.namespace = namespace
+        self.db_path = db_path
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory = OrderedDict()
+        self._lock = threading.RLock()
+        self._conn = None
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'evictions': 0,
+        }
+
+    def _connection(self):
+        """Open the disk tier lazily so importing the module stays cheap"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            ''')
+            self._conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed
+                ON cache_entries (namespace, accessed_at)
+            ''')
+            self._conn.commit()
+        return self._conn
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def _remember(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached value for ``key`` or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return value
+                del self._memory[key]
+
+            if self.db_path is None:
+                self._stats['misses'] += 1
+                return None
+
+            try:
+                conn = self._connection()
+                row = conn.execute(
+                    'SELECT value, created_at FROM cache_entries WHERE namespace = ? AND key = ?',
+                    (self.namespace, key)
+                ).fetchone()
+                if row is not None:
+                    value, created_at = json.loads(row[0]), row[1]
+                    if not self._expired(created_at, now):
+                        conn.execute(
+                            'UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?',
+                            (now, self.namespace, key)
+                        )
+                        conn.commit()
+                        self._remember(key, value, created_at)
+                        self._stats['disk_hits'] += 1
+                        return value
+                    conn.execute(
+                        'DELETE FROM cache_entries WHERE namespace = ? AND key = ?',
+                        (self.namespace, key)
+                    )
+                    conn.commit()
+            except sqlite3.Error as e:
+                print(f"Cache read failed: {str(e)}")
+
+            self._stats['misses'] += 1
+            return None
+
+    def set(self, key, value):
+        """Store ``value`` under ``key`` in both tiers"""
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, value, now)
+            self._stats['writes'] += 1
+            if self.db_path is None:
+                return
+            try:
+                conn = self._connection()
+                conn.execute('''
+                    INSERT OR REPLACE INTO cache_entries
+                        (namespace, key, value, size, created_at, accessed_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (self.namespace, key, payload, len(payload), now, now))
+                conn.commit()
+                self._evict(conn, now)
+            except sqlite3.Error as e:
+                print(f"Cache write failed: {str(e)}")
+
+    def _evict(self, conn, now):
+        """Drop expired entries, then least recently used ones over the size limit"""
+        if self.ttl is not None:
+            cur = conn.execute(
+                'DELETE FROM cache_entries WHERE namespace = ? AND created_at < ?',
+                (self.namespace, now - self.ttl)
+            )
+            self._stats['evictions'] += max(cur.rowcount, 0)
+
+        total = conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?',
+            (self.namespace,)
+        ).fetchone()[0]
+
+        if total > self.max_disk_bytes:
+            rows = conn.execute(
+                'SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY accessed_at',
+                (self.namespace,)
+            ).fetchall()
+            stale = []
+            for key, size in rows:
+                if total <= self.max_disk_bytes:
+                    break
+                stale.append((self.namespace, key))
+                total -= size
+                self._memory.pop(key, None)
+            conn.executemany('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', stale)
+            self._stats['evictions'] += len(stale)
+        conn.commit()
+
+    def clear(self):
+        """Remove every entry in this namespace"""
+        with self._lock:
+            self._memory.clear()
+            if self.db_path is None:
+                return
+            try:
+                conn = self._connection()
+                conn.execute('DELETE FROM cache_entries WHERE namespace = ?', (self.namespace,))
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"Cache clear failed: {str(e)}")
+
+    def stats(self):
+        """Return hit/miss counters for this cache"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['hits'] = stats['memory_hits'] + stats['disk_hits']
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+            stats['memory_entries'] = len(self._memory)
+            return stats
+
+
+class SingleFlight:
+    """Collapse concurrent identical requests into one.
+
+    The first caller for a key becomes the leader and does the work; callers
+    that arrive while it is in flight wait on the same future. Futures are
+    concurrent.futures ones, so threads and asyncio tasks can share them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._stats = {'leaders': 0, 'coalesced': 0}
+
+    def claim(self, key):
+        """Return (future, is_leader) for ``key``"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats['coalesced'] += 1
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            self._stats['leaders'] += 1
+            return future, True
+
+    def resolve(self, key, future, result=None, error=None):
+        """Finish the leader's request and release every waiter"""
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn):
+        """Run ``fn`` once for all concurrent callers with the same key"""
+        future, leader = self.claim(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except Exception as e:
+            self.resolve(key, future, error=e)
+            raise
+        except BaseException:
+            # Cancelled or interrupted: don't leave the waiters hanging
+            self.resolve(key, future, error=RuntimeError("Shared request was cancelled"))
+            raise
+        self.resolve(key, future, result)
+        return result
+
+    async def do_async(self, key, fn):
+        """Async version of do; ``fn`` is a coroutine function"""
+        future, leader = self.claim(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await fn()
+        except Exception as e:
+            self.resolve(key, future, error=e)
+            raise
+        except BaseException:
+            # Cancelled or interrupted: don't leave the waiters hanging
+            self.resolve(key, future, error=RuntimeError("Shared request was cancelled"))
+            raise
+        self.resolve(key, future, result)
+        return result
+
+    def stats(self):
+        """Return how many calls led a request and how many joined one"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._inflight)
+            return stats
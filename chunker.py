@@ -0,0 +1,63 @@
+# Split boundaries, from coarsest to finest: page breaks, paragraphs, lines, sentences, words
+SEPARATORS = ["\f", "\n\n", "\n", ". ", " "]
+
+# Rough average for English prose with Gemini tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Cheap token estimate used for budgeting prompts"""
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _split_recursive(text, max_tokens, level=0):
+    """Break text into pieces under max_tokens, using the coarsest boundary that works"""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    if level >= len(SEPARATORS):
+        # No natural boundary left, fall back to a hard character split
+        size = max_tokens * CHARS_PER_TOKEN
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    sep = SEPARATORS[level]
+    parts = text.split(sep)
+    if len(parts) == 1:
+        return _split_recursive(text, max_tokens, level + 1)
+
+    pieces = []
+    for i, part in enumerate(parts):
+        # Keep the separator attached so packing can restore the original text
+        if i < len(parts) - 1:
+            part += sep
+        pieces.extend(_split_recursive(part, max_tokens, level + 1))
+    return pieces
+
+
+def group_texts(texts, max_tokens):
+    """Greedily pack consecutive texts into groups under max_tokens"""
+    groups = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def split_into_chunks(text, max_tokens=2000):
+    """Split a document into token-budgeted chunks on page or paragraph boundaries"""
+    if not text:
+        return []
+    pieces = _split_recursive(text, max_tokens)
+    chunks = ("".join(group).strip() for group in group_texts(pieces, max_tokens))
+    return [chunk for chunk in chunks if chunk]
@@ -0,0 +1,2 @@
+# test_import.py is a manual check against the live Gemini API, not a test
+collect_ignore = ["test_import.py"]
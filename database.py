@@ -1,12 +1,179 @@
 import sqlite3
+import os
+import queue
+import re
+import threading
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
+from spaced_repetition import DEFAULT_EASE, next_review, now_timestamp
 
-def init_db():
-    """Initialize SQLite database for quiz results"""
-    conn = sqlite3.connect('study_buddy.db')
-    c = conn.cursor()
+# Database location
+DB_PATH = os.getenv('STUDY_BUDDY_DB', 'study_buddy.db')
+
+# Optional write isolation: with 'user' or 'course', each user's (or course's)
+# quiz history and review cards live in their own SQLite file under SHARD_DIR.
+# Users, sessions and shared content always stay in DB_PATH.
+SHARD_MODE = os.getenv('STUDY_BUDDY_SHARD_MODE', 'none')
+SHARD_DIR = os.getenv('STUDY_BUDDY_SHARD_DIR', 'shards')
+
+# Owner of results saved before users existed, and of single-user installs
+DEFAULT_USER_ID = 1
+
+# Connection tuning applied once per connection
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",      # readers don't block the writer
+    "PRAGMA synchronous=NORMAL",    # fsync at checkpoints, not on every commit
+    "PRAGMA cache_size=-20000",     # ~20 MB page cache
+    "PRAGMA mmap_size=268435456",   # 256 MB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Streamlit runs every rerun, and every fragment rerun, on a fresh
+# ScriptRunner thread, so connections can't be tied to threads. Each database
+# file instead gets a small shared pool; a connection is checked out for one
+# operation and handed back, keeping its PRAGMAs and statement cache.
+POOL_SIZE = int(os.getenv('STUDY_BUDDY_DB_POOL_SIZE', '8'))
+POOL_TIMEOUT = 10.0
+
+class _ConnectionPool:
+    """Bounded pool of tuned connections to one database file
+
+    Connections are opened on demand, up to ``size``; past that, callers
+    wait for one to be handed back.
+    """
+    
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()  # most recently used first, its cache is warm
+        self._opened = 0
+        self._lock = threading.Lock()
+    
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=5.0, cached_statements=256,
+                               check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    def _discard(self, conn):
+        conn.close()
+        with self._lock:
+            self._opened -= 1
+    
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self._lock:
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+        if can_open:
+            try:
+                return self._open()
+            except BaseException:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        
+        try:
+            return self._idle.get(timeout=POOL_TIMEOUT)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"No free connection to {self.path} after {POOL_TIMEOUT:.0f}s"
+            ) from None
     
-    c.execute('''
+    def release(self, conn):
+        # Never hand an open transaction to the next caller
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+    
+    def close(self):
+        """Close the idle connections; checked-out ones close when handed back"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+# Database path -> its pool
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Shard files already migrated by this process
+_migrated_shards = set()
+_shards_lock = threading.Lock()
+
+def _shard_path(shard):
+    return DB_PATH if shard is None else os.path.join(SHARD_DIR, f"{shard}.db")
+
+def _pool_for(path):
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = _ConnectionPool(path, POOL_SIZE)
+        return pool
+
+@contextmanager
+def connection(shard=None):
+    """Check a connection to the main database or a shard out of its pool
+
+    Use as ``with connection() as conn:``; the connection goes back to the
+    pool on exit, with any transaction left open rolled back. Shard files
+    are created and migrated the first time they are opened.
+    """
+    path = _shard_path(shard)
+    if shard is not None:
+        os.makedirs(SHARD_DIR, exist_ok=True)
+    pool = _pool_for(path)
+    conn = pool.acquire()
+    try:
+        if shard is not None and path not in _migrated_shards:
+            with _shards_lock:
+                if path not in _migrated_shards:
+                    _migrate(conn)
+                    _migrated_shards.add(path)
+        yield conn
+    finally:
+        pool.release(conn)
+
+# Bumped on every write so callers can tell when cached dashboard data is stale
+_data_version = 0
+_version_lock = threading.Lock()
+
+def get_data_version():
+    """Return a counter that changes whenever quiz results are written"""
+    return _data_version
+
+def _bump_data_version():
+    global _data_version
+    with _version_lock:
+        _data_version += 1
+
+def close_connections():
+    """Close every pooled connection that isn't checked out"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
+
+# Schema migrations, applied in order. PRAGMA user_version records how many
+# have run, so each one executes exactly once per database file.
+MIGRATIONS = [
+    # 1: base table
+    ['''
         CREATE TABLE IF NOT EXISTS quiz_results (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             topic TEXT NOT NULL,
@@ -16,128 +183,716 @@ def init_db():
             percentage REAL NOT NULL,
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    '''],
+    # 2: secondary indexes for history, grouping and topic lookups
+    [
+        'CREATE INDEX IF NOT EXISTS idx_quiz_results_timestamp ON quiz_results (timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_quiz_results_difficulty ON quiz_results (difficulty)',
+        'CREATE INDEX IF NOT EXISTS idx_quiz_results_topic ON quiz_results (topic)',
+    ],
+    # 3: per-difficulty, per-day aggregates kept current by a trigger
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS quiz_daily_stats (
+            difficulty TEXT NOT NULL,
+            day TEXT NOT NULL,
+            quiz_count INTEGER NOT NULL,
+            score_sum INTEGER NOT NULL,
+            question_sum INTEGER NOT NULL,
+            percentage_sum REAL NOT NULL,
+            min_percentage REAL NOT NULL,
+            max_percentage REAL NOT NULL,
+            excellent_count INTEGER NOT NULL,
+            good_count INTEGER NOT NULL,
+            review_count INTEGER NOT NULL,
+            PRIMARY KEY (difficulty, day)
+        )
+        ''',
+        '''
+        INSERT INTO quiz_daily_stats
+        SELECT
+            difficulty,
+            date(timestamp),
+            COUNT(*),
+            SUM(score),
+            SUM(total_questions),
+            SUM(percentage),
+            MIN(percentage),
+            MAX(percentage),
+            SUM(percentage >= 90),
+            SUM(percentage >= 70 AND percentage < 90),
+            SUM(percentage < 70)
+        FROM quiz_results
+        GROUP BY difficulty, date(timestamp)
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_quiz_results_daily_stats
+        AFTER INSERT ON quiz_results
+        BEGIN
+            INSERT INTO quiz_daily_stats VALUES (
+                NEW.difficulty,
+                date(NEW.timestamp),
+                1,
+                NEW.score,
+                NEW.total_questions,
+                NEW.percentage,
+                NEW.percentage,
+                NEW.percentage,
+                NEW.percentage >= 90,
+                NEW.percentage >= 70 AND NEW.percentage < 90,
+                NEW.percentage < 70
+            )
+            ON CONFLICT (difficulty, day) DO UPDATE SET
+                quiz_count = quiz_count + 1,
+                score_sum = score_sum + excluded.score_sum,
+                question_sum = question_sum + excluded.question_sum,
+                percentage_sum = percentage_sum + excluded.percentage_sum,
+                min_percentage = MIN(min_percentage, excluded.min_percentage),
+                max_percentage = MAX(max_percentage, excluded.max_percentage),
+                excellent_count = excellent_count + excluded.excellent_count,
+                good_count = good_count + excluded.good_count,
+                review_count = review_count + excluded.review_count;
+        END
+        ''',
+    ],
+    # 4: stable attempt IDs so a quiz result is stored at most once
+    [
+        'ALTER TABLE quiz_results ADD COLUMN attempt_id TEXT',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_quiz_results_attempt ON quiz_results (attempt_id)',
+    ],
+    # 5: document store (see document_store.py); text and indexes live on disk
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS documents (
+            file_hash TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            page_count INTEGER NOT NULL,
+            char_count INTEGER NOT NULL,
+            page_offsets TEXT NOT NULL,
+            chunk_offsets TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_opened DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_documents_last_opened ON documents (last_opened)',
+        '''
+        CREATE TABLE IF NOT EXISTS document_artifacts (
+            file_hash TEXT NOT NULL REFERENCES documents (file_hash),
+            kind TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            variant INTEGER NOT NULL DEFAULT 0,
+            content TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (file_hash, kind, difficulty, variant)
+        )
+        ''',
+    ],
+    # 6: bank of generated quiz questions and flashcards (see item_bank.py)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS item_bank (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            question TEXT NOT NULL,
+            normalized TEXT NOT NULL,
+            options TEXT,
+            answer TEXT NOT NULL,
+            explanation TEXT,
+            signature BLOB NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_item_bank_normalized ON item_bank (kind, content_hash, difficulty, normalized)',
+        'CREATE INDEX IF NOT EXISTS idx_item_bank_scope ON item_bank (kind, content_hash, difficulty, id)',
+    ],
+    # 7: spaced-repetition state per flashcard, plus a log of every review
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS review_cards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            deck TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            front TEXT NOT NULL,
+            back TEXT NOT NULL,
+            ease REAL NOT NULL,
+            interval_days REAL NOT NULL DEFAULT 0,
+            repetitions INTEGER NOT NULL DEFAULT 0,
+            lapses INTEGER NOT NULL DEFAULT 0,
+            due DATETIME NOT NULL,
+            last_reviewed DATETIME,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (deck, front)
+        )
+        ''',
+        # The due queue is a range scan on these, however many cards exist
+        'CREATE INDEX IF NOT EXISTS idx_review_cards_due ON review_cards (due)',
+        'CREATE INDEX IF NOT EXISTS idx_review_cards_deck_due ON review_cards (deck, due)',
+        '''
+        CREATE TABLE IF NOT EXISTS review_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            card_id INTEGER NOT NULL REFERENCES review_cards (id),
+            grade INTEGER NOT NULL,
+            interval_days REAL NOT NULL,
+            ease REAL NOT NULL,
+            reviewed_at DATETIME NOT NULL
+        )
+        ''',
+    ],
+    # 8: users and sessions; results, aggregates and review cards become per user.
+    # Existing rows belong to DEFAULT_USER_ID.
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            course TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "INSERT OR IGNORE INTO users (id, username) VALUES (1, 'local')",
+        '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            started_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)',
+        
+        'ALTER TABLE quiz_results ADD COLUMN user_id INTEGER NOT NULL DEFAULT 1',
+        'ALTER TABLE quiz_results ADD COLUMN session_id TEXT',
+        # Every history query is per user now, so these replace the global ones
+        'DROP INDEX IF EXISTS idx_quiz_results_timestamp',
+        'DROP INDEX IF EXISTS idx_quiz_results_difficulty',
+        'CREATE INDEX IF NOT EXISTS idx_quiz_results_user_timestamp ON quiz_results (user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_quiz_results_user_difficulty ON quiz_results (user_id, difficulty)',
+        
+        # The primary key changes, so the aggregates table is rebuilt
+        'DROP TRIGGER IF EXISTS trg_quiz_results_daily_stats',
+        '''
+        CREATE TABLE quiz_daily_stats_new (
+            user_id INTEGER NOT NULL,
+            difficulty TEXT NOT NULL,
+            day TEXT NOT NULL,
+            quiz_count INTEGER NOT NULL,
+            score_sum INTEGER NOT NULL,
+            question_sum INTEGER NOT NULL,
+            percentage_sum REAL NOT NULL,
+            min_percentage REAL NOT NULL,
+            max_percentage REAL NOT NULL,
+            excellent_count INTEGER NOT NULL,
+            good_count INTEGER NOT NULL,
+            review_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, difficulty, day)
+        )
+        ''',
+        'INSERT INTO quiz_daily_stats_new SELECT 1, * FROM quiz_daily_stats',
+        'DROP TABLE quiz_daily_stats',
+        'ALTER TABLE quiz_daily_stats_new RENAME TO quiz_daily_stats',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_quiz_results_daily_stats
+        AFTER INSERT ON quiz_results
+        BEGIN
+            INSERT INTO quiz_daily_stats VALUES (
+                NEW.user_id,
+                NEW.difficulty,
+                date(NEW.timestamp),
+                1,
+                NEW.score,
+                NEW.total_questions,
+                NEW.percentage,
+                NEW.percentage,
+                NEW.percentage,
+                NEW.percentage >= 90,
+                NEW.percentage >= 70 AND NEW.percentage < 90,
+                NEW.percentage < 70
+            )
+            ON CONFLICT (user_id, difficulty, day) DO UPDATE SET
+                quiz_count = quiz_count + 1,
+                score_sum = score_sum + excluded.score_sum,
+                question_sum = question_sum + excluded.question_sum,
+                percentage_sum = percentage_sum + excluded.percentage_sum,
+                min_percentage = MIN(min_percentage, excluded.min_percentage),
+                max_percentage = MAX(max_percentage, excluded.max_percentage),
+                excellent_count = excellent_count + excluded.excellent_count,
+                good_count = good_count + excluded.good_count,
+                review_count = review_count + excluded.review_count;
+        END
+        ''',
+        
+        # Same for review cards: uniqueness and the due queue become per user
+        '''
+        CREATE TABLE review_cards_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            deck TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            front TEXT NOT NULL,
+            back TEXT NOT NULL,
+            ease REAL NOT NULL,
+            interval_days REAL NOT NULL DEFAULT 0,
+            repetitions INTEGER NOT NULL DEFAULT 0,
+            lapses INTEGER NOT NULL DEFAULT 0,
+            due DATETIME NOT NULL,
+            last_reviewed DATETIME,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (user_id, deck, front)
+        )
+        ''',
+        '''
+        INSERT INTO review_cards_new
+        SELECT id, 1, deck, topic, difficulty, front, back, ease, interval_days, repetitions,
+               lapses, due, last_reviewed, created_at
+        FROM review_cards
+        ''',
+        'DROP TABLE review_cards',
+        'ALTER TABLE review_cards_new RENAME TO review_cards',
+        'CREATE INDEX IF NOT EXISTS idx_review_cards_user_due ON review_cards (user_id, due)',
+        'CREATE INDEX IF NOT EXISTS idx_review_cards_user_deck_due ON review_cards (user_id, deck, due)',
+    ],
+]
 
-def save_quiz_result(topic, difficulty, score, total):
-    """Save quiz result to database"""
-    conn = sqlite3.connect('study_buddy.db')
+def _migrate(conn):
+    """Apply pending migrations to one database file"""
     c = conn.cursor()
     
-    percentage = (score / total) * 100 if total > 0 else 0
-    
-    c.execute('''
-        INSERT INTO quiz_results (topic, difficulty, score, total_questions, percentage)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (topic, difficulty, score, total, percentage))
-    
-    conn.commit()
-    conn.close()
+    # IMMEDIATE takes the write lock first, so concurrent starts migrate once
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        version = c.execute('PRAGMA user_version').fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                c.execute(statement)
+            c.execute(f'PRAGMA user_version = {number}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
 
-def get_quiz_history():
-    """Retrieve quiz history"""
-    conn = sqlite3.connect('study_buddy.db')
-    c = conn.cursor()
-    
-    c.execute('''
-        SELECT topic, difficulty, score, total_questions, percentage, timestamp
-        FROM quiz_results
-        ORDER BY timestamp DESC
-        LIMIT 20
-    ''')
-    
-    results = c.fetchall()
-    conn.close()
-    
-    return results
+def init_db():
+    """Initialize SQLite database for quiz results, applying pending migrations"""
+    with connection() as conn:
+        _migrate(conn)
 
-def get_performance_stats():
-    """Get overall performance statistics"""
-    conn = sqlite3.connect('study_buddy.db')
-    c = conn.cursor()
-    
-    c.execute('''
-        SELECT 
-            COUNT(*) as total_quizzes,
-            AVG(percentage) as avg_score,
-            MAX(percentage) as best_score,
-            MIN(percentage) as lowest_score
-        FROM quiz_results
-    ''')
-    
-    stats = c.fetchone()
-    conn.close()
-    
-    return stats
+def _slug(text):
+    return re.sub(r'[^a-z0-9]+', '_', text.lower()).strip('_') or 'default'
 
-def get_performance_by_difficulty():
-    """Get average performance by difficulty level"""
-    conn = sqlite3.connect('study_buddy.db')
-    c = conn.cursor()
-    
-    c.execute('''
-        SELECT 
-            difficulty,
-            AVG(percentage) as avg_score,
-            COUNT(*) as quiz_count
-        FROM quiz_results
-        GROUP BY difficulty
-        ORDER BY 
-            CASE difficulty
-                WHEN 'Easy' THEN 1
-                WHEN 'Intermediate' THEN 2
-                WHEN 'Advanced' THEN 3
-            END
-    ''')
-    
-    results = c.fetchall()
-    conn.close()
-    
-    return results
+# user_id -> course, for course sharding
+_user_courses = {}
 
-def get_score_distribution():
-    """Get distribution of scores"""
-    conn = sqlite3.connect('study_buddy.db')
-    c = conn.cursor()
-    
-    c.execute('''
-        SELECT 
-            CASE 
-                WHEN percentage >= 90 THEN 'Excellent'
-                WHEN percentage >= 70 THEN 'Good'
-                ELSE 'Needs Review'
-            END as category,
-            COUNT(*) as count
-        FROM quiz_results
-        GROUP BY category
-        ORDER BY
-            CASE category
-                WHEN 'Excellent' THEN 1
-                WHEN 'Good' THEN 2
-                ELSE 3
-            END
-    ''')
-    
-    results = c.fetchall()
-    conn.close()
+def _shard_for(user_id):
+    """Shard holding this user's history, or None for the main database"""
+    if SHARD_MODE == 'user':
+        return f"user_{user_id}"
+    if SHARD_MODE == 'course':
+        if user_id not in _user_courses:
+            with connection() as conn:
+                row = conn.execute(
+                    'SELECT course FROM users WHERE id = ?', (user_id,)
+                ).fetchone()
+            _user_courses[user_id] = row[0] if row else None
+        course = _user_courses[user_id]
+        return f"course_{_slug(course)}" if course else None
+    return None
+
+def _user_connection(user_id):
+    """Pooled connection (a context manager) to the database file holding
+    this user's results and reviews"""
+    return connection(_shard_for(user_id))
+
+def get_or_create_user(username, course=None):
+    """Return the id of the user with this name, creating them on first use
+
+    A ``course`` replaces the user's stored course; None keeps it. With
+    course sharding the course picks the file new results are written to.
+    """
+    with connection() as conn:
+        with conn:
+            conn.execute('''
+                INSERT INTO users (username, course)
+                VALUES (?, ?)
+                ON CONFLICT (username) DO UPDATE SET
+                    course = COALESCE(excluded.course, users.course)
+            ''', (username, course))
+        
+        user_id, course = conn.execute(
+            'SELECT id, course FROM users WHERE username = ?', (username,)
+        ).fetchone()
     
-    return results
+    # Keep _shard_for in step with the stored course
+    _user_courses[user_id] = course
+    return user_id
 
-def get_recent_trend(limit=5):
-    """Get recent quiz trend"""
-    conn = sqlite3.connect('study_buddy.db')
-    c = conn.cursor()
+def start_session(user_id):
+    """Record a new app session for the user and return its id"""
+    with connection() as conn:
+        session_id = uuid.uuid4().hex
+        
+        with conn:
+            conn.execute('INSERT INTO sessions (id, user_id) VALUES (?, ?)', (session_id, user_id))
+        
+        return session_id
+
+def save_quiz_result(topic, difficulty, score, total, attempt_id=None,
+                     user_id=DEFAULT_USER_ID, session_id=None):
+    """Save quiz result to database
+
+    With an ``attempt_id`` the write is idempotent: saving the same attempt
+    again is a no-op. Returns True if a new row was stored.
+    """
+    with _user_connection(user_id) as conn:
+        percentage = (score / total) * 100 if total > 0 else 0
+        
+        # Commit on success, roll back on error so the pooled connection stays clean
+        with conn:
+            cur = conn.execute('''
+                INSERT INTO quiz_results (topic, difficulty, score, total_questions, percentage,
+                                          attempt_id, user_id, session_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (attempt_id) DO NOTHING
+            ''', (topic, difficulty, score, total, percentage, attempt_id, user_id, session_id))
+        
+        inserted = cur.rowcount == 1
+        if inserted:
+            _bump_data_version()
+        return inserted
+
+def get_quiz_history(user_id=DEFAULT_USER_ID):
+    """Retrieve a user's quiz history"""
+    with _user_connection(user_id) as conn:
+        c = conn.cursor()
+        
+        c.execute('''
+            SELECT topic, difficulty, score, total_questions, percentage, timestamp
+            FROM quiz_results
+            WHERE user_id = ?
+            ORDER BY timestamp DESC
+            LIMIT 20
+        ''', (user_id,))
+        
+        results = c.fetchall()
+        
+        return results
+
+def get_performance_stats(user_id=DEFAULT_USER_ID):
+    """Get a user's overall performance statistics"""
+    with _user_connection(user_id) as conn:
+        c = conn.cursor()
+        
+        # Read from the daily aggregates: O(buckets), not O(rows)
+        c.execute('''
+            SELECT 
+                COALESCE(SUM(quiz_count), 0) as total_quizzes,
+                SUM(percentage_sum) / SUM(quiz_count) as avg_score,
+                MAX(max_percentage) as best_score,
+                MIN(min_percentage) as lowest_score
+            FROM quiz_daily_stats
+            WHERE user_id = ?
+        ''', (user_id,))
+        
+        stats = c.fetchone()
+        
+        return stats
+
+def get_performance_by_difficulty(user_id=DEFAULT_USER_ID):
+    """Get a user's average performance by difficulty level"""
+    with _user_connection(user_id) as conn:
+        c = conn.cursor()
+        
+        c.execute('''
+            SELECT 
+                difficulty,
+                SUM(percentage_sum) / SUM(quiz_count) as avg_score,
+                SUM(quiz_count) as quiz_count
+            FROM quiz_daily_stats
+            WHERE user_id = ?
+            GROUP BY difficulty
+            ORDER BY 
+                CASE difficulty
+                    WHEN 'Easy' THEN 1
+                    WHEN 'Intermediate' THEN 2
+                    WHEN 'Advanced' THEN 3
+                END
+        ''', (user_id,))
+        
+        results = c.fetchall()
+        
+        return results
+
+def get_score_distribution(user_id=DEFAULT_USER_ID):
+    """Get the distribution of a user's scores"""
+    with _user_connection(user_id) as conn:
+        c = conn.cursor()
+        
+        c.execute('''
+            WITH totals AS (
+                SELECT
+                    SUM(excellent_count) as excellent,
+                    SUM(good_count) as good,
+                    SUM(review_count) as review
+                FROM quiz_daily_stats
+                WHERE user_id = ?
+            )
+            SELECT 'Excellent', excellent FROM totals WHERE excellent > 0
+            UNION ALL
+            SELECT 'Good', good FROM totals WHERE good > 0
+            UNION ALL
+            SELECT 'Needs Review', review FROM totals WHERE review > 0
+        ''', (user_id,))
+        
+        results = c.fetchall()
+        
+        return results
+
+def get_recent_trend(limit=5, user_id=DEFAULT_USER_ID):
+    """Get a user's recent quiz trend"""
+    with _user_connection(user_id) as conn:
+        c = conn.cursor()
+        
+        c.execute('''
+            SELECT percentage, timestamp
+            FROM quiz_results
+            WHERE user_id = ?
+            ORDER BY timestamp DESC
+            LIMIT ?
+        ''', (user_id, limit))
+        
+        results = c.fetchall()
+        
+        return results
+
+class DashboardSnapshot(NamedTuple):
+    """Everything the Progress tab shows, computed over one user's quiz results"""
+    total_quizzes: int
+    avg_score: Optional[float]
+    best_score: Optional[float]
+    lowest_score: Optional[float]
+    total_questions: int
+    total_correct: int
+    excellent: int
+    good: int
+    needs_review: int
+    quizzes_last_7_days: int
+    recent_average: Optional[float]     # average of the last 3 quizzes, None if fewer
+    most_practiced: Optional[str]
+    most_practiced_count: int
+    by_difficulty: List[Tuple[str, float, int]]     # (difficulty, avg_score, quiz_count)
+    recent_history: List[tuple]     # same rows as get_quiz_history()
+
+def get_dashboard_snapshot(user_id=DEFAULT_USER_ID):
+    """Compute all of a user's dashboard figures in a single read transaction
+
+    Every statement is a range scan on a (user_id, ...) index or key, so
+    the cost grows with this user's history, not with the user count.
+    """
+    with _user_connection(user_id) as conn:
+        c = conn.cursor()
+        
+        # One consistent view of the table for all three statements
+        c.execute('BEGIN')
+        try:
+            c.execute('''
+                WITH totals AS (
+                    SELECT
+                        SUM(quiz_count) as quiz_count,
+                        SUM(percentage_sum) / SUM(quiz_count) as avg_score,
+                        MAX(max_percentage) as best_score,
+                        MIN(min_percentage) as lowest_score,
+                        SUM(question_sum) as question_sum,
+                        SUM(score_sum) as score_sum,
+                        SUM(excellent_count) as excellent,
+                        SUM(good_count) as good,
+                        SUM(review_count) as review
+                    FROM quiz_daily_stats
+                    WHERE user_id = :user_id
+                ),
+                practice AS (
+                    SELECT difficulty, SUM(quiz_count) as quiz_count
+                    FROM quiz_daily_stats
+                    WHERE user_id = :user_id
+                    GROUP BY difficulty
+                    ORDER BY quiz_count DESC
+                    LIMIT 1
+                ),
+                last_three AS (
+                    SELECT percentage
+                    FROM quiz_results
+                    WHERE user_id = :user_id
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT 3
+                )
+                SELECT
+                    COALESCE(quiz_count, 0),
+                    avg_score,
+                    best_score,
+                    lowest_score,
+                    COALESCE(question_sum, 0),
+                    COALESCE(score_sum, 0),
+                    COALESCE(excellent, 0),
+                    COALESCE(good, 0),
+                    COALESCE(review, 0),
+                    (SELECT COUNT(*) FROM quiz_results
+                     WHERE user_id = :user_id AND timestamp > datetime('now', '-7 days')),
+                    (SELECT AVG(percentage) FROM last_three),
+                    (SELECT COUNT(*) FROM last_three),
+                    (SELECT difficulty FROM practice),
+                    COALESCE((SELECT quiz_count FROM practice), 0)
+                FROM totals
+            ''', {'user_id': user_id})
+            summary = c.fetchone()
+            
+            c.execute('''
+                SELECT 
+                    difficulty,
+                    SUM(percentage_sum) / SUM(quiz_count) as avg_score,
+                    SUM(quiz_count) as quiz_count
+                FROM quiz_daily_stats
+                WHERE user_id = ?
+                GROUP BY difficulty
+                ORDER BY 
+                    CASE difficulty
+                        WHEN 'Easy' THEN 1
+                        WHEN 'Intermediate' THEN 2
+                        WHEN 'Advanced' THEN 3
+                    END
+            ''', (user_id,))
+            by_difficulty = c.fetchall()
+            
+            c.execute('''
+                SELECT topic, difficulty, score, total_questions, percentage, timestamp
+                FROM quiz_results
+                WHERE user_id = ?
+                ORDER BY timestamp DESC, id DESC
+                LIMIT 20
+            ''', (user_id,))
+            recent_history = c.fetchall()
+        finally:
+            conn.commit()
     
-    c.execute('''
-        SELECT percentage, timestamp
-        FROM quiz_results
-        ORDER BY timestamp DESC
-        LIMIT ?
-    ''', (limit,))
+    (total_quizzes, avg_score, best_score, lowest_score, total_questions, total_correct,
+     excellent, good, needs_review, last_7_days, recent_average, recent_count,
+     most_practiced, most_practiced_count) = summary
     
-    results = c.fetchall()
-    conn.close()
+    return DashboardSnapshot(
+        total_quizzes=total_quizzes,
+        avg_score=avg_score,
+        best_score=best_score,
+        lowest_score=lowest_score,
+        total_questions=total_questions,
+        total_correct=total_correct,
+        excellent=excellent,
+        good=good,
+        needs_review=needs_review,
+        quizzes_last_7_days=last_7_days,
+        recent_average=recent_average if recent_count >= 3 else None,
+        most_practiced=most_practiced,
+        most_practiced_count=most_practiced_count,
+        by_difficulty=by_difficulty,
+        recent_history=recent_history
+    )
+
+def add_review_cards(deck, topic, difficulty, cards, user_id=DEFAULT_USER_ID):
+    """Add flashcards to the review schedule, due immediately
+
+    ``deck`` groups cards from one source (e.g. a content hash). Cards
+    already in the user's deck are left as they are. Returns the number added.
+    """
+    with _user_connection(user_id) as conn:
+        now = now_timestamp()
+        
+        with conn:
+            cur = conn.executemany('''
+                INSERT INTO review_cards (user_id, deck, topic, difficulty, front, back, ease, due)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, deck, front) DO NOTHING
+            ''', [
+                (user_id, deck, topic, difficulty, card['front'], card['back'], DEFAULT_EASE, now)
+                for card in cards
+            ])
+        
+        return cur.rowcount
+
+def get_due_cards(limit=20, deck=None, user_id=DEFAULT_USER_ID):
+    """A user's cards due for review, most overdue first
+
+    Rows are (id, front, back, topic, repetitions). Served from the due
+    index, so the cost depends on ``limit``, not on the number of cards.
+    """
+    with _user_connection(user_id) as conn:
+        c = conn.cursor()
+        now = now_timestamp()
+        
+        if deck is None:
+            c.execute('''
+                SELECT id, front, back, topic, repetitions
+                FROM review_cards
+                WHERE user_id = ? AND due <= ?
+                ORDER BY due
+                LIMIT ?
+            ''', (user_id, now, limit))
+        else:
+            c.execute('''
+                SELECT id, front, back, topic, repetitions
+                FROM review_cards
+                WHERE user_id = ? AND deck = ? AND due <= ?
+                ORDER BY due
+                LIMIT ?
+            ''', (user_id, deck, now, limit))
+        
+        results = c.fetchall()
+        
+        return results
+
+def grade_cards(grades, user_id=DEFAULT_USER_ID):
+    """Record a batch of reviews in one transaction
+
+    ``grades`` is a list of (card_id, grade) using the grades in
+    spaced_repetition. Each card is rescheduled with SM-2 and every review
+    is logged.
+    """
+    if not grades:
+        return
     
-    return results
\ No newline at end of file
+    with _user_connection(user_id) as conn:
+        now = now_timestamp()
+        ids = [card_id for card_id, _ in grades]
+        placeholders = ",".join("?" * len(ids))
+        
+        with conn:
+            state = {
+                row[0]: row[1:] for row in conn.execute(f'''
+                    SELECT id, ease, interval_days, repetitions
+                    FROM review_cards
+                    WHERE user_id = ? AND id IN ({placeholders})
+                ''', [user_id] + ids)
+            }
+            
+            updates = []
+            log = []
+            for card_id, grade in grades:
+                if card_id not in state:
+                    continue
+                # Apply reviews in order, in case one card was graded twice
+                ease, interval_days, repetitions = state[card_id]
+                ease, interval_days, repetitions, lapsed, due = next_review(
+                    ease, interval_days, repetitions, grade
+                )
+                state[card_id] = (ease, interval_days, repetitions)
+                updates.append((ease, interval_days, repetitions, int(lapsed), due, now, card_id))
+                log.append((card_id, grade, interval_days, ease, now))
+            
+            conn.executemany('''
+                UPDATE review_cards
+                SET ease = ?, interval_days = ?, repetitions = ?, lapses = lapses + ?,
+                    due = ?, last_reviewed = ?
+                WHERE id = ?
+            ''', updates)
+            conn.executemany('''
+                INSERT INTO review_log (card_id, grade, interval_days, ease, reviewed_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', log)
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import tempfile
+from database import connection
+from pdf_processor import extract_pdf_cached
+
+# Extracted text and retrieval indexes live here; metadata and artifacts in SQLite
+DOCUMENTS_DIR = os.getenv('STUDY_BUDDY_DOCUMENTS_DIR', 'documents')
+
+
+def _text_path(file_hash):
+    return os.path.join(DOCUMENTS_DIR, f"{file_hash}.txt")
+
+
+def index_path(file_hash):
+    """Path prefix of a document's saved retrieval index (for VectorIndex.load)"""
+    return os.path.join(DOCUMENTS_DIR, f"{file_hash}.index")
+
+
+def _page_offsets(text):
+    """Character offset where each page starts (pages are separated by form feeds)"""
+    offsets = [0]
+    position = text.find("\f")
+    while position != -1:
+        offsets.append(position + 1)
+        position = text.find("\f", position + 1)
+    return offsets
+
+
+def _chunk_offsets(text, chunks):
+    """[start, end) character span of each chunk within text"""
+    spans = []
+    cursor = 0
+    for chunk in chunks:
+        start = text.find(chunk, cursor)
+        if start == -1:
+            spans.append(None)
+            continue
+        spans.append([start, start + len(chunk)])
+        cursor = start + len(chunk)
+    return spans
+
+
+def _write_atomic(path, text):
+    """Write via a temp file so concurrent sessions never see a partial file
+
+    The temp name is unique per call, so two threads storing the same
+    document don't share (and then move away) one temp file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=DOCUMENTS_DIR, suffix='.tmp')
+    try:
+        with open(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def save_document(file_hash, name, text, page_count):
+    """Store a document's text, page offsets, chunks and retrieval index
+
+    Storing the same file hash again is a no-op.
+    """
+    with connection() as conn:
+        if conn.execute('SELECT 1 FROM documents WHERE file_hash = ?', (file_hash,)).fetchone():
+            return
+
+    os.makedirs(DOCUMENTS_DIR, exist_ok=True)
+    _write_atomic(_text_path(file_hash), text)
+
+    # Chunk and embed once, so reopening skips straight to retrieval.
+    # Imported here so numpy only loads once a document is stored.
+    # No pooled connection is held meanwhile.
+    from retrieval import VectorIndex
+    index = VectorIndex.build(text)
+    index.save(index_path(file_hash))
+
+    with connection() as conn, conn:
+        conn.execute('''
+            INSERT INTO documents (file_hash, name, page_count, char_count, page_offsets, chunk_offsets)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (file_hash) DO NOTHING
+        ''', (
+            file_hash, name, page_count, len(text),
+            json.dumps(_page_offsets(text)), json.dumps(_chunk_offsets(text, index.chunks))
+        ))
+
+def get_document(file_hash):
+    """Return a stored document as a dict, or None if it is unknown
+
+    The dict has the same keys as extract_pdf_cached plus name,
+    page_offsets and chunk_offsets. Opening a document marks it as
+    recently used.
+    """
+    with connection() as conn:
+        row = conn.execute('''
+            SELECT name, page_count, char_count, page_offsets, chunk_offsets
+            FROM documents
+            WHERE file_hash = ?
+        ''', (file_hash,)).fetchone()
+        if row is None:
+            return None
+
+        try:
+            with open(_text_path(file_hash), encoding='utf-8') as f:
+                text = f.read()
+        except OSError as e:
+            print(f"Stored document text is missing: {str(e)}")
+            return None
+
+        with conn:
+            conn.execute(
+                'UPDATE documents SET last_opened = CURRENT_TIMESTAMP WHERE file_hash = ?',
+                (file_hash,)
+            )
+
+        name, page_count, char_count, page_offsets, chunk_offsets = row
+        return {
+            'text': text,
+            'page_count': page_count,
+            'char_count': char_count,
+            'extraction_time': 0.0,
+            'file_hash': file_hash,
+            'name': name,
+            'page_offsets': json.loads(page_offsets),
+            'chunk_offsets': json.loads(chunk_offsets),
+        }
+
+
+def open_pdf(pdf_bytes, name, progress=None):
+    """Return the stored document for these bytes, extracting and storing it on first upload
+
+    Adds a ``reopened`` flag to the returned dict. Failed extractions are
+    returned as-is and not stored.
+    """
+    file_hash = hashlib.sha256(pdf_bytes).hexdigest()
+    document = get_document(file_hash)
+    if document is not None:
+        document['reopened'] = True
+        return document
+
+    document = extract_pdf_cached(pdf_bytes, progress=progress)
+    if document['page_count'] > 0:
+        try:
+            save_document(file_hash, name, document['text'], document['page_count'])
+        except Exception as e:
+            print(f"Error storing document: {str(e)}")
+    document = dict(document, name=name, reopened=False)
+    return document
+
+
+def list_documents(limit=50):
+    """Stored documents, newest first
+
+    Rows are (file_hash, name, page_count, char_count, last_opened). The
+    order only changes when a document is added, not when one is opened,
+    so a list shown to one session isn't reshuffled by another.
+    """
+    with connection() as conn:
+        return conn.execute('''
+            SELECT file_hash, name, page_count, char_count, last_opened
+            FROM documents
+            ORDER BY created_at DESC, file_hash
+            LIMIT ?
+        ''', (limit,)).fetchall()
+
+
+def save_artifact(file_hash, kind, difficulty, content, variant=0):
+    """Keep a generated summary, key point list, quiz or deck for a document
+
+    Saving the same (kind, difficulty, variant) again replaces it.
+    """
+    with connection() as conn:
+        with conn:
+            conn.execute('''
+                INSERT INTO document_artifacts (file_hash, kind, difficulty, variant, content)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (file_hash, kind, difficulty, variant) DO UPDATE SET
+                    content = excluded.content,
+                    created_at = CURRENT_TIMESTAMP
+            ''', (file_hash, kind, difficulty, variant, json.dumps(content)))
+
+
+def get_artifact(file_hash, kind, difficulty, variant=0):
+    """Return a stored artifact, or None"""
+    with connection() as conn:
+        row = conn.execute('''
+            SELECT content
+            FROM document_artifacts
+            WHERE file_hash = ? AND kind = ? AND difficulty = ? AND variant = ?
+        ''', (file_hash, kind, difficulty, variant)).fetchone()
+        return json.loads(row[0]) if row else None
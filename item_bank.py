@@ -0,0 +1,156 @@
+import hashlib
+import json
+import random
+import re
+import zlib
+from array import array
+from cache import normalize_content
+from database import connection
+
+# MinHash settings: character 5-shingles (robust to small rewordings of
+# short questions), 64 hash functions
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 64
+# Estimated Jaccard similarity above which two items count as duplicates
+DUPLICATE_THRESHOLD = 0.8
+
+# Largest number of existing questions listed in a prompt as "don't repeat"
+MAX_AVOID_ITEMS = 30
+
+_PRIME = (1 << 61) - 1
+# Fixed seed: signatures are stored, so the hash functions must never change
+_seed = random.Random(20240518)
+_PERMUTATIONS = [
+    (_seed.randrange(1, _PRIME), _seed.randrange(0, _PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+_NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+# Which field of an item is its prompt and which its answer
+_FIELDS = {
+    'quiz': ('question', 'correct_answer'),
+    'flashcard': ('front', 'back'),
+}
+
+
+def content_hash(content):
+    """Hash of the normalized source content an item was generated from"""
+    return hashlib.sha256(normalize_content(content).encode('utf-8')).hexdigest()
+
+
+def normalize_text(text):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return _NON_WORD_RE.sub(' ', (text or "").lower()).strip()
+
+
+def shingles(text):
+    """Set of overlapping character n-grams of the normalized text"""
+    text = normalize_text(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """MinHash signature of the text's shingles"""
+    hashes = [zlib.crc32(s.encode('utf-8')) for s in shingles(text)]
+    return array('Q', (min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS))
+
+
+def similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity of two signatures"""
+    matches = sum(1 for a, b in zip(signature_a, signature_b) if a == b)
+    return matches / NUM_PERMUTATIONS
+
+
+def _to_row(kind, item):
+    """Split an item into (question, options, answer, explanation)"""
+    prompt_field, answer_field = _FIELDS[kind]
+    options = item.get('options')
+    return (
+        item[prompt_field],
+        json.dumps(options) if options is not None else None,
+        item[answer_field],
+        item.get('explanation'),
+    )
+
+
+def _from_row(kind, question, options, answer, explanation):
+    prompt_field, answer_field = _FIELDS[kind]
+    item = {prompt_field: question}
+    if options is not None:
+        item['options'] = json.loads(options)
+    item[answer_field] = answer
+    if explanation is not None:
+        item['explanation'] = explanation
+    return item
+
+
+def draw_items(kind, content, difficulty, limit, offset=0):
+    """Return up to ``limit`` banked items for this content, oldest first
+
+    ``offset`` skips items, so successive quizzes draw successive slices.
+    """
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT question, options, answer, explanation
+            FROM item_bank
+            WHERE kind = ? AND content_hash = ? AND difficulty = ?
+            ORDER BY id
+            LIMIT ? OFFSET ?
+        ''', (kind, content_hash(content), difficulty, limit, offset)).fetchall()
+        return [_from_row(kind, *row) for row in rows]
+
+
+def banked_questions(kind, content, difficulty, limit=MAX_AVOID_ITEMS):
+    """Most recent banked question texts, for telling the model what not to repeat"""
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT question
+            FROM item_bank
+            WHERE kind = ? AND content_hash = ? AND difficulty = ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (kind, content_hash(content), difficulty, limit)).fetchall()
+        return [row[0] for row in rows]
+
+
+def add_items(kind, content, difficulty, items):
+    """Add generated items to the bank, skipping near-duplicates
+
+    An item is a duplicate if its MinHash similarity to an item already
+    banked for the same content and difficulty (or earlier in ``items``)
+    reaches DUPLICATE_THRESHOLD. Returns the number of items added.
+    """
+    if not items:
+        return 0
+
+    digest = content_hash(content)
+    with connection() as conn:
+        added = 0
+        # IMMEDIATE so concurrent sessions can't both add the same question
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            signatures = [
+                array('Q', row[0]) for row in conn.execute('''
+                    SELECT signature
+                    FROM item_bank
+                    WHERE kind = ? AND content_hash = ? AND difficulty = ?
+                ''', (kind, digest, difficulty))
+            ]
+            for item in items:
+                question, options, answer, explanation = _to_row(kind, item)
+                signature = minhash(question)
+                if any(similarity(signature, other) >= DUPLICATE_THRESHOLD for other in signatures):
+                    continue
+                cur = conn.execute('''
+                    INSERT INTO item_bank (kind, content_hash, topic, difficulty, question, normalized,
+                                           options, answer, explanation, signature)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (kind, content_hash, difficulty, normalized) DO NOTHING
+                ''', (kind, digest, (content or "")[:100], difficulty, question, normalize_text(question),
+                      options, answer, explanation, signature.tobytes()))
+                signatures.append(signature)
+                added += cur.rowcount
+        return added
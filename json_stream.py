@@ -0,0 +1,72 @@
+import json
+
+
+class JsonArrayStream:
+    """Incrementally pull complete objects out of a streamed JSON array.
+
+    Feed text chunks as they arrive; each call returns the top-level objects
+    of the array that were closed by that chunk. Anything before the opening
+    ``[`` (code fences, stray prose) is ignored, and an item that fails to
+    parse is skipped instead of failing the whole array.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._item = []
+
+    def feed(self, text):
+        """Consume a chunk of text and return the objects it completed"""
+        items = []
+        for char in text:
+            if self.finished:
+                break
+
+            if not self.started:
+                if char == '[':
+                    self.started = True
+                continue
+
+            if self._depth == 0:
+                # Between items: only an object start or the closing bracket matter
+                if char == '{':
+                    self._depth = 1
+                    self._item = [char]
+                elif char == ']':
+                    self.finished = True
+                continue
+
+            self._item.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    raw = "".join(self._item)
+                    self._item = []
+                    try:
+                        items.append(json.loads(raw))
+                    except json.JSONDecodeError as e:
+                        print(f"Skipping malformed item in stream: {str(e)}")
+        return items
+
+
+def iter_json_array(chunks):
+    """Yield each object of a JSON array from an iterable of text chunks"""
+    parser = JsonArrayStream()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+        if parser.finished:
+            break
@@ -0,0 +1,78 @@
+import os
+from prompt_budget import output_budget
+
+# Fast: no thinking for drill material, quickest responses
+# Balanced: a little thinking where correctness depends on it
+# Quality: room to reason at every level
+PROFILES = ('Fast', 'Balanced', 'Quality')
+FALLBACK_PROFILE = 'Balanced'
+
+# Thinking tokens per profile and difficulty; 0 turns thinking off
+THINKING_BUDGETS = {
+    'Fast': {'Easy': 0, 'Intermediate': 0, 'Advanced': 512},
+    'Balanced': {'Easy': 0, 'Intermediate': 512, 'Advanced': 1024},
+    'Quality': {'Easy': 1024, 'Intermediate': 2048, 'Advanced': 4096},
+}
+
+# Share of the thinking budget each generator gets. Quiz answer keys and
+# explanations need reasoning; notes, summaries and flashcards barely do.
+THINKING_WEIGHTS = {
+    'explain_concept': 1.0,
+    'generate_quiz': 1.0,
+    'summarize_content': 0.5,
+    'extract_key_points': 0.5,
+    'generate_flashcards': 0.25,
+    'summarize_chunk': 0.0,
+    'merge_notes': 0.0,
+}
+
+# Answer length set by the prompt for each level, as a share of the output
+# budget. Quizzes and decks are sized by their item count instead.
+ANSWER_SCALES = {'Easy': 0.5, 'Intermediate': 0.75, 'Advanced': 1.0}
+SCALED_FUNCTIONS = {'explain_concept', 'summarize_content', 'extract_key_points'}
+
+TEMPERATURES = {
+    'explain_concept': 0.7,
+    'summarize_content': 0.3,
+    'extract_key_points': 0.3,
+    # Higher for variety between quiz rounds and decks
+    'generate_quiz': 0.9,
+    'generate_flashcards': 0.9,
+    'summarize_chunk': 0.2,
+    'merge_notes': 0.2,
+}
+DEFAULT_TEMPERATURE = 0.7
+
+
+def resolve_profile(profile=None):
+    """Return a known profile name, falling back to STUDY_BUDDY_PROFILE"""
+    if profile in PROFILES:
+        return profile
+    configured = os.getenv('STUDY_BUDDY_PROFILE', FALLBACK_PROFILE).strip().capitalize()
+    return configured if configured in PROFILES else FALLBACK_PROFILE
+
+
+DEFAULT_PROFILE = resolve_profile()
+
+
+def generation_settings(function_name, difficulty=None, profile=None):
+    """Thinking budget, output cap and temperature for one generator call
+
+    ``difficulty`` is None for difficulty-neutral calls (map-reduce notes),
+    which are budgeted as Intermediate.
+    """
+    profile = resolve_profile(profile)
+    level = difficulty if difficulty in ANSWER_SCALES else 'Intermediate'
+
+    thinking = int(THINKING_BUDGETS[profile][level] * THINKING_WEIGHTS.get(function_name, 1.0))
+    answer = output_budget(function_name)
+    if function_name in SCALED_FUNCTIONS:
+        answer = int(answer * ANSWER_SCALES[level])
+
+    return {
+        'profile': profile,
+        'thinking_budget': thinking,
+        # Thinking tokens count toward max_output_tokens on 2.5 models
+        'max_output_tokens': answer + thinking,
+        'temperature': TEMPERATURES.get(function_name, DEFAULT_TEMPERATURE),
+    }
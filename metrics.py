@@ -0,0 +1,94 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger("study_buddy")
+
+
+def _configure_logger():
+    """Send the app's log records to stderr at STUDY_BUDDY_LOG_LEVEL (default INFO)
+
+    Streamlit only configures its own loggers, so without a handler every
+    INFO record here would be dropped.
+    """
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(handler)
+    level = os.getenv('STUDY_BUDDY_LOG_LEVEL', 'INFO').upper()
+    logger.setLevel(level if isinstance(logging.getLevelName(level), int) else logging.INFO)
+    # Handled here; don't print twice if the root logger is configured too
+    logger.propagate = False
+
+
+_configure_logger()
+
+# Most recent timings, newest last
+_recent = deque(maxlen=200)
+_lock = threading.Lock()
+
+
+def record_latency(function_name, total, first_token=None, cached=False, profile=None):
+    """Record how long a generator call took
+
+    ``first_token`` is the time to the first streamed chunk, or None for
+    blocking calls. ``profile`` is the latency profile the call ran with.
+    Times are in seconds.
+    """
+    entry = {
+        'function': function_name,
+        'total': total,
+        'first_token': first_token,
+        'cached': cached,
+        'profile': profile,
+        'at': time.time(),
+    }
+    with _lock:
+        _recent.append(entry)
+
+    if first_token is None:
+        logger.info("%s took %.3fs (profile=%s, cached=%s)", function_name, total, profile, cached)
+    else:
+        logger.info("%s first token %.3fs, total %.3fs (profile=%s, cached=%s)",
+                    function_name, first_token, total, profile, cached)
+    return entry
+
+
+def get_recent_latencies(function_name=None, profile=None):
+    """Return recorded timings, optionally filtered to one function or profile"""
+    with _lock:
+        entries = list(_recent)
+    if function_name is not None:
+        entries = [e for e in entries if e['function'] == function_name]
+    if profile is not None:
+        entries = [e for e in entries if e['profile'] == profile]
+    return entries
+
+
+# Prompt tokens before and after compression/budgeting, per function
+_token_totals = {}
+
+
+def record_token_savings(function_name, original_tokens, final_tokens):
+    """Record how many prompt tokens budgeting saved for one call"""
+    with _lock:
+        totals = _token_totals.setdefault(function_name, {'original': 0, 'final': 0, 'calls': 0})
+        totals['original'] += original_tokens
+        totals['final'] += final_tokens
+        totals['calls'] += 1
+
+    if original_tokens > final_tokens:
+        logger.info("%s prompt content %d -> %d tokens (saved %d)",
+                    function_name, original_tokens, final_tokens,
+                    original_tokens - final_tokens)
+
+
+def get_token_savings():
+    """Return per-function token totals plus an overall 'saved' count"""
+    with _lock:
+        totals = {name: dict(t) for name, t in _token_totals.items()}
+    saved = sum(t['original'] - t['final'] for t in totals.values())
+    return {'by_function': totals, 'saved': saved}
@@ -1,16 +1,185 @@
-from pypdf import PdfReader
+import atexit
+import hashlib
 import io
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from cache import TieredCache
+
+# Extracted PDFs keyed by a hash of the uploaded bytes, in memory only:
+# document_store keeps the text of every stored document on disk
+extraction_cache = TieredCache(namespace="pdf_text", db_path=None, memory_entries=16)
+
+# Parallel extraction settings
+PDF_WORKERS = int(os.getenv('STUDY_BUDDY_PDF_WORKERS', os.cpu_count() or 1))
+MIN_PARALLEL_PAGES = 16     # below this, a process pool costs more than it saves
+SHARDS_PER_WORKER = 4       # smaller shards keep workers busy and progress smooth
+
+# One pool for the life of the server, started on first use. Workers are
+# spawned, not forked: forking a process that runs Streamlit's threads can
+# copy a lock held by another thread into the child and deadlock it.
+_pool = None
+_pool_lock = threading.Lock()
+
+# Each worker parses the current document once and keeps the reader for its shards
+_worker_document = (None, None)
+
+def _open_reader(pdf_bytes):
+    """Parse a PDF; pypdf is imported on first use to keep app startup fast"""
+    from pypdf import PdfReader
+    return PdfReader(io.BytesIO(pdf_bytes))
+
+def _extract_shard(pdf_path, start, stop):
+    """Extract pages [start, stop) of the PDF at pdf_path in a worker process"""
+    global _worker_document
+    path, reader = _worker_document
+    if path != pdf_path:
+        with open(pdf_path, 'rb') as f:
+            reader = _open_reader(f.read())
+        _worker_document = (pdf_path, reader)
+    return start, [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+def _get_pool():
+    """The shared extraction pool, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+def _discard_pool(pool):
+    """Drop a pool whose worker died, so the next extraction starts a new one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+@atexit.register
+def shutdown_pool():
+    """Stop the extraction workers"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _as_bytes(pdf_file):
+    """Accept raw bytes, a file-like object or a path"""
+    if isinstance(pdf_file, (bytes, bytearray)):
+        return bytes(pdf_file)
+    if hasattr(pdf_file, 'read'):
+        return pdf_file.read()
+    with open(pdf_file, 'rb') as f:
+        return f.read()
+
+def _iter_reader_pages(reader, pdf_bytes, workers):
+    """Yield (page_index, text) from an already parsed reader"""
+    page_count = len(reader.pages)
+
+    if workers <= 1 or page_count < MIN_PARALLEL_PAGES:
+        for i, page in enumerate(reader.pages):
+            yield i, page.extract_text() or ""
+        return
+
+    shard_size = max(1, -(-page_count // (workers * SHARDS_PER_WORKER)))
+    # Workers read the document from a temp file, so each shard's task
+    # carries a path instead of the whole PDF
+    pool = _get_pool()
+    fd, pdf_path = tempfile.mkstemp(suffix='.pdf')
+    futures = []
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pdf_bytes)
+        futures = [
+            pool.submit(_extract_shard, pdf_path, start, min(start + shard_size, page_count))
+            for start in range(0, page_count, shard_size)
+        ]
+        for future in as_completed(futures):
+            start, texts = future.result()
+            for offset, text in enumerate(texts):
+                yield start + offset, text
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+        os.remove(pdf_path)
+
+def iter_pages(pdf_bytes, workers=None):
+    """Yield (page_index, text) for every page as soon as it is extracted
+
+    Large documents are split into page-range shards across a process pool,
+    so pages arrive out of order. Small documents are read in-process.
+    """
+    reader = _open_reader(pdf_bytes)
+    yield from _iter_reader_pages(reader, pdf_bytes, workers or PDF_WORKERS)
+
+def extract_pages(pdf_bytes, workers=None, progress=None):
+    """Return a list with the text of each page, in page order
+
+    ``progress`` is called as progress(pages_done, page_count) while
+    pages come in.
+    """
+    reader = _open_reader(pdf_bytes)
+    page_count = len(reader.pages)
+    pages = [""] * page_count
+    pages_done = _iter_reader_pages(reader, pdf_bytes, workers or PDF_WORKERS)
+    for done, (index, text) in enumerate(pages_done, start=1):
+        pages[index] = text
+        if progress:
+            progress(done, page_count)
+    return pages
 
 def extract_text_from_pdf(pdf_file):
     """Extract text content from uploaded PDF"""
     try:
-        # Read PDF file
-        pdf_reader = PdfReader(pdf_file)
-        
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        
-        return text.strip()
+        pages = extract_pages(_as_bytes(pdf_file))
+        # Join once instead of growing a string page by page
+        return "\n".join(pages).strip()
     except Exception as e:
-        return f"Error reading PDF: {str(e)}"
\ No newline at end of file
+        return f"Error reading PDF: {str(e)}"
+
+def extract_pdf_cached(pdf_bytes, progress=None):
+    """Extract a PDF once per unique file, keyed by a hash of its bytes
+
+    Returns a dict with the text plus page_count, char_count,
+    extraction_time (seconds) and file_hash. Failed extractions are not
+    cached; their text holds the error message as before.
+    """
+    file_hash = hashlib.sha256(pdf_bytes).hexdigest()
+    cached = extraction_cache.get(file_hash)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    try:
+        pages = extract_pages(pdf_bytes, progress=progress)
+    except Exception as e:
+        return {
+            'text': f"Error reading PDF: {str(e)}",
+            'page_count': 0,
+            'char_count': 0,
+            'extraction_time': time.perf_counter() - start,
+            'file_hash': file_hash
+        }
+
+    # Form feeds mark page breaks for the chunker and prompt compression
+    text = "\f".join(pages).strip()
+    result = {
+        'text': text,
+        'page_count': len(pages),
+        'char_count': len(text),
+        'extraction_time': time.perf_counter() - start,
+        'file_hash': file_hash
+    }
+    extraction_cache.set(file_hash, result)
+    return result
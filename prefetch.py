@@ -0,0 +1,82 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ai_helper import generate_flashcards, generate_quiz
+from scheduler import BACKGROUND, use_priority
+
+# Shared by all sessions so prefetching can never crowd out the app
+PREFETCH_WORKERS = 2
+_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+
+
+def _content_key(content, difficulty):
+    """Identify the content a prefetch was made for"""
+    digest = hashlib.sha256((content or "").encode('utf-8')).hexdigest()
+    return digest, difficulty
+
+
+def _run_in_background(fn, *args, **kwargs):
+    """Run a generator call at background priority"""
+    with use_priority(BACKGROUND):
+        return fn(*args, **kwargs)
+
+
+class Prefetcher:
+    """Generates the next quiz or flashcard deck while the student works.
+
+    Results land in the response cache under the next variant number, so
+    asking for that variant later is a cache hit. If it is still being
+    generated, the request joins it through ai_helper's single-flight layer.
+    Keep one Prefetcher per session.
+    """
+
+    def __init__(self, max_pending=2):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._content = None
+
+    def track_content(self, content, difficulty):
+        """Cancel queued work if the content or level changed"""
+        key = _content_key(content, difficulty)
+        if key != self._content:
+            self.cancel()
+            self._content = key
+
+    def _schedule(self, job_key, fn, *args, **kwargs):
+        with self._lock:
+            # Finished jobs are kept so reruns don't schedule them again
+            pending = sum(1 for f in self._futures.values() if not f.done())
+            if job_key in self._futures or pending >= self.max_pending:
+                return False
+            self._futures[job_key] = _executor.submit(_run_in_background, fn, *args, **kwargs)
+            return True
+
+    def prefetch_quiz(self, content, difficulty, num_questions, variant, profile=None):
+        """Start generating quiz ``variant`` in the background"""
+        self.track_content(content, difficulty)
+        return self._schedule(
+            ('quiz', num_questions, variant, profile),
+            generate_quiz, content, difficulty, num_questions, variant, profile=profile
+        )
+
+    def prefetch_flashcards(self, content, difficulty, num_cards, variant, profile=None):
+        """Start generating flashcard deck ``variant`` in the background"""
+        self.track_content(content, difficulty)
+        return self._schedule(
+            ('flashcards', num_cards, variant, profile),
+            generate_flashcards, content, difficulty, num_cards, variant, profile=profile
+        )
+
+    def cancel(self):
+        """Cancel prefetches that have not started; running ones just finish"""
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures = {}
+            self._content = None
+
+    def pending(self):
+        """Number of prefetches queued or running for this session"""
+        with self._lock:
+            return sum(1 for f in self._futures.values() if not f.done())
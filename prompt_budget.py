@@ -0,0 +1,184 @@
+import re
+from collections import Counter
+from chunker import estimate_tokens
+from metrics import record_token_savings
+
+# Most user content (tokens) each generator may put in its prompt
+INPUT_BUDGETS = {
+    'explain_concept': 3000,
+    'summarize_content': 2000,
+    'extract_key_points': 2000,
+    'generate_quiz': 3000,
+    'generate_flashcards': 3000,
+    'summarize_chunk': 2000,
+    'merge_notes': 2000,
+}
+DEFAULT_INPUT_BUDGET = 2000
+
+# Caps on the visible answer (tokens). The latency profile scales these by
+# level and adds its thinking budget on top (see latency_profiles.py).
+OUTPUT_BUDGETS = {
+    'explain_concept': 4096,
+    'summarize_content': 2048,
+    'extract_key_points': 2048,
+    'generate_quiz': 4096,
+    'generate_flashcards': 3072,
+    'summarize_chunk': 1536,
+    'merge_notes': 2048,
+}
+DEFAULT_OUTPUT_BUDGET = 4096
+
+# Short lines repeated at the top or bottom of most pages (at least
+# BOILERPLATE_MIN_PAGES) are running headers/footers
+BOILERPLATE_MIN_PAGES = 3
+BOILERPLATE_MIN_SHARE = 0.6
+HEADER_MAX_CHARS = 60
+EDGE_LINES = 2
+# Longer lines are dropped when repeated verbatim (duplicated extraction)
+DUPLICATE_MIN_CHARS = 40
+
+_PAGE_NUMBER_RE = re.compile(r'^(page\s*)?\d+(\s*(of|/)\s*\d+)?$', re.IGNORECASE)
+_HYPHEN_BREAK_RE = re.compile(r'(\w)-\n(\w)')
+_SPACES_RE = re.compile(r'[ \t\v]+')
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+_DIGITS_RE = re.compile(r'\d+')
+
+
+def input_budget(function_name):
+    return INPUT_BUDGETS.get(function_name, DEFAULT_INPUT_BUDGET)
+
+
+def output_budget(function_name):
+    return OUTPUT_BUDGETS.get(function_name, DEFAULT_OUTPUT_BUDGET)
+
+
+def _shape(line):
+    """Line with numbers masked, so "Page 3" and "Page 4" look alike"""
+    return _DIGITS_RE.sub('#', line)
+
+
+def _edge_lines(page):
+    """Positions of the first and last non-blank lines of a page
+
+    Short pages get fewer edge lines, so at least one line in the middle
+    is always treated as body text.
+    """
+    filled = [i for i, line in enumerate(page) if line]
+    edge = max(1, min(EDGE_LINES, (len(filled) - 1) // 2))
+    return set(filled[:edge] + filled[-edge:])
+
+
+def _header_candidate(line):
+    """Short lines may be headers; page numbers are matched on their own,
+    so a bare number in the body never looks like one"""
+    return len(line) <= HEADER_MAX_CHARS and not _PAGE_NUMBER_RE.match(line)
+
+
+def _running_lines(pages):
+    """Shapes of short lines repeated at the top or bottom of most pages"""
+    counts = Counter()
+    for page in pages:
+        counts.update({_shape(page[i]) for i in _edge_lines(page) if _header_candidate(page[i])})
+    min_pages = max(BOILERPLATE_MIN_PAGES, BOILERPLATE_MIN_SHARE * len(pages))
+    return {shape for shape, n in counts.items() if n >= min_pages}
+
+
+def _page_boilerplate(page, running):
+    """Positions of a page's page number and running header/footer lines
+
+    Page numbers are only looked for on the first and last line, headers
+    and footers on the edge lines. Empty when they are all the page has,
+    so a page is never emptied.
+    """
+    edges = _edge_lines(page)
+    drop = {
+        i for i in edges
+        if _header_candidate(page[i]) and _shape(page[i]) in running
+    }
+    if edges:
+        drop.update(i for i in (min(edges), max(edges)) if _PAGE_NUMBER_RE.match(page[i]))
+    if all(i in drop or not line for i, line in enumerate(page)):
+        return set()
+    return drop
+
+
+def compress_text(text):
+    """Shrink extracted text without losing content
+
+    Normalizes whitespace, rejoins hyphenated words split across line
+    breaks (keeping the hyphen, which may belong to a compound such as
+    "well-known"), and removes long lines repeated verbatim. When pages
+    are separated by form feeds, as in extract_pdf_cached output, page
+    numbers and running headers/footers at the page edges are dropped too;
+    single-page and typed text keeps every line.
+    """
+    if not text:
+        return ""
+
+    text = _HYPHEN_BREAK_RE.sub(r'\1-\2', text)
+    pages = [
+        [_SPACES_RE.sub(' ', line).strip() for line in page.split('\n')]
+        for page in text.split('\f')
+    ]
+    paged = len(pages) > 1
+    running = _running_lines(pages) if len(pages) >= BOILERPLATE_MIN_PAGES else set()
+
+    kept = []
+    seen = set()
+    for page in pages:
+        boilerplate = _page_boilerplate(page, running) if paged else set()
+        for i, line in enumerate(page):
+            if not line:
+                kept.append(line)
+                continue
+            if i in boilerplate:
+                continue
+            if len(line) >= DUPLICATE_MIN_CHARS:
+                if line in seen:
+                    continue
+                seen.add(line)
+            kept.append(line)
+
+    return _BLANK_LINES_RE.sub('\n\n', '\n'.join(kept)).strip()
+
+
+def fit_to_budget(text, max_tokens):
+    """Trim text to max_tokens, cutting at a paragraph or sentence boundary if possible"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max_tokens * 4]
+    for boundary in ('\n\n', '\n', '. '):
+        position = cut.rfind(boundary)
+        # Only use a boundary that keeps most of the budget
+        if position > len(cut) * 0.8:
+            return cut[:position + len(boundary)].rstrip()
+    return cut
+
+
+def prepare_content(function_name, text, condense=None):
+    """Compress and budget user content for one generator's prompt
+
+    ``condense(text, max_tokens)`` is tried before truncating content that is
+    still over budget after compression (ai_helper passes its map-reduce).
+    Returns (content, report), where report has original_tokens,
+    final_tokens, saved_tokens and truncated. Savings are also recorded in
+    metrics.
+    """
+    text = text or ""
+    budget = input_budget(function_name)
+    original_tokens = estimate_tokens(text)
+
+    content = compress_text(text)
+    if condense is not None and estimate_tokens(content) > budget:
+        content = condense(content, budget)
+    final = fit_to_budget(content, budget)
+    final_tokens = estimate_tokens(final)
+
+    report = {
+        'original_tokens': original_tokens,
+        'final_tokens': final_tokens,
+        'saved_tokens': original_tokens - final_tokens,
+        'truncated': len(final) < len(content),
+    }
+    record_token_savings(function_name, original_tokens, final_tokens)
+    return final, report
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import zlib
+from collections import Counter, OrderedDict
+import numpy as np
+from chunker import split_into_chunks
+
+# Chunk size for retrieval; smaller than the map-reduce chunks so hits are focused
+RETRIEVAL_CHUNK_TOKENS = 300
+
+# Dimensions of the hashed TF-IDF vectors used when no embedding model is available
+HASHED_DIMENSIONS = 4096
+
+# Optional local embedding model (needs the sentence-transformers package)
+EMBEDDING_MODEL = os.getenv('STUDY_BUDDY_EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def _tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _get_embedder():
+    """Load the local embedding model once, or return None if unavailable"""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+                _embedder = SentenceTransformer(EMBEDDING_MODEL, device='cpu')
+            except Exception as e:
+                print(f"Embedding model unavailable, using TF-IDF: {str(e)}")
+                _embedder = False
+        return _embedder or None
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class _HashedTfidf:
+    """TF-IDF over a fixed number of hashed term buckets"""
+
+    def __init__(self, idf):
+        self.idf = idf
+
+    @staticmethod
+    def _counts(text):
+        row = np.zeros(HASHED_DIMENSIONS, dtype=np.float32)
+        for term, count in Counter(_tokenize(text)).items():
+            # crc32 is stable across processes, unlike hash()
+            row[zlib.crc32(term.encode('utf-8')) % HASHED_DIMENSIONS] += count
+        return row
+
+    @classmethod
+    def fit(cls, chunks):
+        counts = np.stack([cls._counts(chunk) for chunk in chunks])
+        doc_freq = (counts > 0).sum(axis=0)
+        idf = np.log((1 + len(chunks)) / (1 + doc_freq)).astype(np.float32) + 1
+        model = cls(idf)
+        return model, model._weigh(counts)
+
+    def _weigh(self, counts):
+        # Sublinear term frequency keeps long repetitive chunks from dominating
+        tf = np.log1p(counts)
+        return _normalize_rows(tf * self.idf)
+
+    def encode(self, texts):
+        return self._weigh(np.stack([self._counts(t) for t in texts]))
+
+
+def _write_atomic(path, mode, write):
+    """Call write(f) on a temp file next to ``path``, then move it into place"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with open(fd, mode, encoding=None if 'b' in mode else 'utf-8') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class VectorIndex:
+    """Chunks of one document and their L2-normalized vectors (rows)"""
+
+    def __init__(self, chunks, vectors, backend, idf=None):
+        self.chunks = chunks
+        self.vectors = vectors
+        self.backend = backend
+        self._tfidf = _HashedTfidf(idf) if idf is not None else None
+
+    @classmethod
+    def build(cls, text, chunk_tokens=RETRIEVAL_CHUNK_TOKENS):
+        """Chunk and embed a document"""
+        chunks = split_into_chunks(text, chunk_tokens)
+        if not chunks:
+            return cls([], np.zeros((0, HASHED_DIMENSIONS), dtype=np.float32), 'tfidf',
+                       np.ones(HASHED_DIMENSIONS, dtype=np.float32))
+
+        embedder = _get_embedder()
+        if embedder is not None:
+            vectors = embedder.encode(chunks, normalize_embeddings=True, convert_to_numpy=True)
+            return cls(chunks, vectors.astype(np.float32), 'embedding')
+
+        model, vectors = _HashedTfidf.fit(chunks)
+        return cls(chunks, vectors, 'tfidf', model.idf)
+
+    def as_tfidf(self):
+        """The same chunks with hashed TF-IDF vectors
+
+        For an index saved with embeddings but loaded where the embedding
+        model isn't available, whose queries could not be encoded.
+        """
+        model, vectors = _HashedTfidf.fit(self.chunks)
+        return VectorIndex(self.chunks, vectors, 'tfidf', model.idf)
+
+    def _encode_query(self, query):
+        if self.backend == 'embedding':
+            embedder = _get_embedder()
+            return embedder.encode([query], normalize_embeddings=True, convert_to_numpy=True)[0]
+        return self._tfidf.encode([query])[0]
+
+    def search(self, query, k=5):
+        """Return the k most similar chunks as (chunk_index, score), best first"""
+        if not self.chunks or not query:
+            return []
+        scores = self.vectors @ self._encode_query(query)
+        k = min(k, len(self.chunks))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def save(self, path):
+        """Write the index to ``path``.npy / ``path``.json
+
+        Each file is written to a temp file and moved into place, so a
+        concurrent load never reads a partial index. The .json goes last.
+        """
+        meta = {
+            'chunks': self.chunks,
+            'backend': self.backend,
+            'idf': self._tfidf.idf.tolist() if self._tfidf is not None else None,
+        }
+        _write_atomic(f"{path}.npy", 'wb', lambda f: np.save(f, self.vectors))
+        _write_atomic(f"{path}.json", 'w', lambda f: json.dump(meta, f))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Read an index written by save; vectors are memory-mapped by default"""
+        with open(f"{path}.json", encoding='utf-8') as f:
+            meta = json.load(f)
+        vectors = np.load(f"{path}.npy", mmap_mode='r' if mmap else None)
+        idf = np.asarray(meta['idf'], dtype=np.float32) if meta['idf'] is not None else None
+        return cls(meta['chunks'], vectors, meta['backend'], idf)
+
+
+# Recently built indexes, keyed by a hash of the document text
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+MAX_CACHED_INDEXES = 8
+
+
+def get_index(text, path=None):
+    """Return the retrieval index for a document, building it on first use
+
+    With ``path``, an index saved there (see document_store) is loaded
+    instead of rebuilding it.
+    """
+    key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    with _indexes_lock:
+        if key in _indexes:
+            _indexes.move_to_end(key)
+            return _indexes[key]
+
+    if path is not None and os.path.exists(f"{path}.npy"):
+        index = VectorIndex.load(path)
+        if index.backend == 'embedding' and index.chunks and _get_embedder() is None:
+            index = index.as_tfidf()
+    else:
+        index = VectorIndex.build(text)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def retrieve_context(text, query, k=5, index_path=None):
+    """Return the k chunks of ``text`` most relevant to ``query``, in document order"""
+    index = get_index(text, index_path)
+    hits = sorted(i for i, _ in index.search(query, k))
+    return "\n\n".join(index.chunks[i] for i in hits)
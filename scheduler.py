@@ -0,0 +1,337 @@
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Request priorities: lower numbers are served first
+INTERACTIVE = 0
+BACKGROUND = 10
+
+# HTTP status codes worth retrying (quota, overload, transient server errors)
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Priority for requests made in the current thread or task
+_current_priority = contextvars.ContextVar('request_priority', default=INTERACTIVE)
+
+
+@contextmanager
+def use_priority(priority):
+    """Run the enclosed model calls at the given priority"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the backend while the circuit breaker is open"""
+
+
+def _status_code(error):
+    """Best-effort HTTP status of an SDK error"""
+    for attr in ('code', 'status_code'):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+@functools.lru_cache(maxsize=1)
+def _transient_error_types():
+    """Exception types that mean the backend could not be reached or failed
+
+    google-genai sends requests through httpx, whose transport errors
+    (ConnectError, ReadTimeout, ...) do not subclass the builtin ones.
+    Imported on first use so the SDK stays off the startup path.
+    """
+    types = [TimeoutError, ConnectionError]
+    try:
+        import httpx
+        types.append(httpx.TransportError)
+    except ImportError:
+        pass
+    try:
+        from google.genai import errors
+        types.append(errors.ServerError)
+    except ImportError:
+        pass
+    return tuple(types)
+
+
+def is_retryable(error):
+    """True for quota, overload and transient network errors"""
+    if isinstance(error, _transient_error_types()):
+        return True
+    return _status_code(error) in RETRYABLE_STATUS_CODES
+
+
+class TokenBucket:
+    """Token bucket whose rate backs off on quota errors and recovers on success
+
+    The refill rate halves on every throttle (down to ``min_rate``) and
+    climbs back by ``recovery_step`` per success, up to the configured rate.
+    Not thread-safe on its own; RequestScheduler guards it with a lock.
+    """
+
+    def __init__(self, rate, capacity, min_rate=None, recovery_step=None, clock=time.monotonic):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = min_rate if min_rate is not None else rate / 16
+        self.recovery_step = recovery_step if recovery_step is not None else rate / 20
+        self.tokens = capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """Take a token if one is available; otherwise return seconds to wait"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def throttle(self):
+        """Multiplicative decrease after a quota error"""
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def recover(self):
+        """Additive increase after a successful call"""
+        self.rate = min(self.max_rate, self.rate + self.recovery_step)
+
+
+class CircuitBreaker:
+    """Fail fast after repeated backend failures, then probe with one request
+
+    closed -> open after ``failure_threshold`` consecutive failures;
+    open -> half-open after ``reset_timeout`` seconds; a success in
+    half-open closes the circuit, a failure opens it again.
+    Not thread-safe on its own; RequestScheduler guards it with a lock.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self._clock = clock
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self):
+        """Return True if a request may be sent now"""
+        if self.state == 'open':
+            if self._clock() - self._opened_at < self.reset_timeout:
+                return False
+            self.state = 'half_open'
+            self._probe_in_flight = False
+        if self.state == 'half_open':
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        self.state = 'closed'
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release(self):
+        """Free the half-open probe slot without judging the backend's health"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            self.state = 'open'
+            self._opened_at = self._clock()
+
+
+class RequestScheduler:
+    """Shared front door for model calls: rate limit, retry, circuit breaker, priority
+
+    ``call`` and ``call_async`` wrap any callable, so the scheduler can be
+    exercised with a fake client. ``clock``, ``sleep``, ``async_sleep`` and
+    ``rng`` are injectable for the same reason; every wait for a token or a
+    retry goes through ``sleep`` / ``async_sleep``, so a fake clock that
+    advances when slept on drives the scheduler without real delays.
+    """
+
+    def __init__(self, requests_per_minute=60, burst=10, max_retries=3,
+                 base_delay=1.0, max_delay=30.0, failure_threshold=5, reset_timeout=30.0,
+                 clock=time.monotonic, sleep=time.sleep, async_sleep=asyncio.sleep,
+                 rng=random.random):
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst, clock=clock)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, clock=clock)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._async_sleep = async_sleep
+        self._rng = rng
+        self._lock = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._stats = {'calls': 0, 'retries': 0, 'failures': 0, 'rejected': 0}
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff"""
+        return self._rng() * min(self.max_delay, self.base_delay * (2 ** attempt))
+
+    def _try_admit(self, ticket):
+        """Admit the ticket if it heads the queue and a token is free; else return wait time"""
+        if self._waiting[0] != ticket:
+            return None
+        wait = self.bucket.try_acquire()
+        if wait == 0:
+            heapq.heappop(self._waiting)
+            self._lock.notify_all()
+        return wait
+
+    def _abandon(self, ticket):
+        """Drop a ticket whose caller gave up waiting (e.g. a cancelled task)"""
+        with self._lock:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._lock.notify_all()
+
+    def _acquire(self, priority):
+        """Block until this request may go, serving higher priorities first"""
+        with self._lock:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_admit(ticket)
+                    if wait == 0:
+                        return
+                    if wait is None:
+                        # Not at the head: woken when the queue moves
+                        self._lock.wait()
+                        continue
+                # At the head, waiting for the bucket to refill
+                self._sleep(wait)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+
+    async def _acquire_async(self, priority):
+        """Async version of _acquire that sleeps instead of blocking the loop"""
+        with self._lock:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_admit(ticket)
+                if wait == 0:
+                    return
+                await self._async_sleep(wait if wait is not None else 0.05)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+
+    def _before_attempt(self):
+        with self._lock:
+            if not self.breaker.allow():
+                self._stats['rejected'] += 1
+                raise CircuitOpenError("AI service is temporarily unavailable, please try again shortly")
+            self._stats['calls'] += 1
+
+    def _after_error(self, error, attempt):
+        """Record a failed attempt; return the delay before retrying, or None to give up"""
+        with self._lock:
+            if not is_retryable(error):
+                if _status_code(error) is not None:
+                    # The backend answered; a bad request says nothing about its health
+                    self.breaker.record_success()
+                else:
+                    # Not a backend response at all (e.g. a bug in our own code)
+                    self.breaker.release()
+                return None
+            self._stats['failures'] += 1
+            self.breaker.record_failure()
+            if _status_code(error) == 429:
+                self.bucket.throttle()
+            if attempt >= self.max_retries or self.breaker.state == 'open':
+                return None
+            self._stats['retries'] += 1
+        return self._backoff(attempt)
+
+    def _release_probe(self):
+        with self._lock:
+            self.breaker.release()
+
+    def _after_success(self):
+        with self._lock:
+            self.breaker.record_success()
+            self.bucket.recover()
+
+    def call(self, fn, *args, priority=None, **kwargs):
+        """Call ``fn`` under the rate limit, retrying retryable errors"""
+        priority = _current_priority.get() if priority is None else priority
+        attempt = 0
+        while True:
+            self._before_attempt()
+            try:
+                self._acquire(priority)
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._after_error(e, attempt)
+                if delay is None:
+                    raise
+            except BaseException:
+                # Interrupted: a half-open probe must not stay claimed forever
+                self._release_probe()
+                raise
+            else:
+                self._after_success()
+                return result
+            self._sleep(delay)
+            attempt += 1
+
+    async def call_async(self, fn, *args, priority=None, **kwargs):
+        """Async version of call; ``fn`` returns an awaitable"""
+        priority = _current_priority.get() if priority is None else priority
+        attempt = 0
+        while True:
+            self._before_attempt()
+            try:
+                await self._acquire_async(priority)
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._after_error(e, attempt)
+                if delay is None:
+                    raise
+            except BaseException:
+                # Cancelled (CancelledError is a BaseException): free the half-open probe
+                self._release_probe()
+                raise
+            else:
+                self._after_success()
+                return result
+            await self._async_sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        """Return call/retry counters and the current limiter and breaker state"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['rate_per_minute'] = self.bucket.rate * 60
+            stats['circuit'] = self.breaker.state
+            stats['queued'] = len(self._waiting)
+            return stats
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta, timezone
+
+# Review grades, as offered on the flashcard buttons (SM-2 quality scores)
+AGAIN = 1
+HARD = 3
+GOOD = 4
+EASY = 5
+
+GRADE_LABELS = {AGAIN: "Again", HARD: "Hard", GOOD: "Good", EASY: "Easy"}
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+# A forgotten card comes back within the same study session
+AGAIN_DELAY = timedelta(minutes=10)
+# Easy answers stretch the interval a little further than plain SM-2
+EASY_BONUS = 1.3
+
+# Same format as SQLite's CURRENT_TIMESTAMP, so due dates compare as text
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def now_timestamp(now=None):
+    """Current UTC time in SQLite's CURRENT_TIMESTAMP format"""
+    return (now or datetime.now(timezone.utc)).strftime(TIMESTAMP_FORMAT)
+
+
+def next_review(ease, interval_days, repetitions, grade, now=None):
+    """Apply one SM-2 review
+
+    Returns (ease, interval_days, repetitions, lapsed, due) where due is a
+    timestamp string. Grades below HARD count as a lapse: the card restarts
+    and is due again after AGAIN_DELAY.
+    """
+    now = now or datetime.now(timezone.utc)
+    ease = max(MIN_EASE, ease + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+
+    if grade < HARD:
+        return ease, 0.0, 0, True, now_timestamp(now + AGAIN_DELAY)
+
+    if repetitions == 0:
+        interval_days = 1.0
+    elif repetitions == 1:
+        interval_days = 6.0
+    else:
+        interval_days = interval_days * ease
+    if grade == EASY:
+        interval_days *= EASY_BONUS
+
+    due = now + timedelta(days=interval_days)
+    return ease, interval_days, repetitions + 1, False, now_timestamp(due)
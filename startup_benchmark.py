@@ -0,0 +1,105 @@
+"""Measure the app's cold-start import time
+
+Every measurement runs in a fresh interpreter with ``python -X importtime``,
+as an autoscaled container would on its first request:
+
+    python startup_benchmark.py [--repeat 5] [--top 15]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Imported by app.py before the first paint
+APP_MODULES = [
+    'streamlit',
+    'database',
+    'ai_helper',
+    'document_store',
+    'item_bank',
+    'latency_profiles',
+    'metrics',
+    'prefetch',
+    'spaced_repetition',
+]
+
+# Loaded on first use only; listed to show what deferring them saves
+DEFERRED_MODULES = ['google.genai', 'pandas', 'numpy', 'pypdf', 'retrieval']
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_times(modules):
+    """Import modules in a fresh interpreter
+
+    Returns {module: (self_us, cumulative_us, depth)} for everything that was
+    imported, or None if the import failed (e.g. package not installed).
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {', '.join(modules)}"],
+        capture_output=True, text=True, cwd=ROOT
+    )
+    if result.returncode != 0:
+        return None
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return times
+
+
+def total_ms(times):
+    """Cumulative time of the top-level imports, in milliseconds"""
+    return sum(cumulative for _, cumulative, depth in times.values() if depth == 0) / 1000
+
+
+def measure(modules, repeat):
+    """Median total_ms over ``repeat`` runs, plus the last run's details"""
+    runs = [import_times(modules) for _ in range(repeat)]
+    if any(run is None for run in runs):
+        return None, None
+    return statistics.median(total_ms(run) for run in runs), runs[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help="runs per measurement (median is reported)")
+    parser.add_argument('--top', type=int, default=15, help="slowest modules to list")
+    args = parser.parse_args()
+
+    print(f"Python {sys.version.split()[0]}, median of {args.repeat} cold runs\n")
+
+    print(f"{'module':<24}{'import (ms)':>12}")
+    for module in APP_MODULES + DEFERRED_MODULES:
+        elapsed, _ = measure([module], args.repeat)
+        note = " (deferred)" if module in DEFERRED_MODULES else ""
+        if elapsed is None:
+            print(f"{module:<24}{'failed':>12}{note}")
+        else:
+            print(f"{module:<24}{elapsed:>12.1f}{note}")
+
+    elapsed, times = measure(APP_MODULES, args.repeat)
+    if elapsed is None:
+        print("\nCould not import the app's startup modules; is every requirement installed?")
+        return 1
+
+    print(f"\nApp startup imports: {elapsed:.1f} ms")
+    print(f"\nSlowest modules by self time (last run):")
+    slowest = sorted(times.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us, _) in slowest:
+        print(f"  {name:<40}{self_us / 1000:>8.1f} ms self {cumulative_us / 1000:>8.1f} ms cumulative")
+
+    loaded = [module for module in DEFERRED_MODULES if module in times]
+    if loaded:
+        print(f"\nDeferred modules loaded at startup: {', '.join(loaded)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
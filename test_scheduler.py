@@ -0,0 +1,263 @@
+"""Scheduler tests against a fake client and a fake clock
+
+Run with ``python -m unittest test_scheduler`` (or pytest). No network,
+API key or real waiting is needed: every sleep advances the fake clock.
+"""
+import asyncio
+import unittest
+
+from scheduler import BACKGROUND, INTERACTIVE, CircuitOpenError, RequestScheduler, use_priority
+
+
+class FakeClock:
+    """Monotonic time that only moves when something sleeps on it"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+    async def async_sleep(self, seconds):
+        self.sleep(seconds)
+        # Let other tasks run, as a real sleep would
+        await asyncio.sleep(0)
+
+
+class FakeAPIError(Exception):
+    """SDK-style error carrying an HTTP status code"""
+
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+class FakeClient:
+    """Returns scripted outcomes in order ("ok" once they run out); exceptions are raised"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def generate(self, prompt):
+        self.calls.append(prompt)
+        outcome = self.outcomes.pop(0) if self.outcomes else "ok"
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    async def generate_async(self, prompt):
+        return self.generate(prompt)
+
+
+def make_scheduler(clock, **kwargs):
+    """Scheduler on the fake clock, with backoff jitter pinned to its maximum"""
+    options = dict(requests_per_minute=60, burst=10, max_retries=3, base_delay=1.0,
+                   failure_threshold=5, reset_timeout=30.0)
+    options.update(kwargs)
+    return RequestScheduler(clock=clock, sleep=clock.sleep, async_sleep=clock.async_sleep,
+                            rng=lambda: 1.0, **options)
+
+
+class RetryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_transient_errors_are_retried_with_exponential_backoff(self):
+        client = FakeClient(FakeAPIError(503), FakeAPIError(503), "answer")
+        scheduler = make_scheduler(self.clock)
+
+        self.assertEqual(scheduler.call(client.generate, "q"), "answer")
+        self.assertEqual(len(client.calls), 3)
+        # Burst tokens are free, so the only sleeps are the backoffs
+        self.assertEqual(self.clock.slept, [1.0, 2.0])
+        self.assertEqual(scheduler.stats()['retries'], 2)
+
+    def test_network_errors_are_retried(self):
+        client = FakeClient(ConnectionResetError("reset"), TimeoutError(), "answer")
+        scheduler = make_scheduler(self.clock)
+
+        self.assertEqual(scheduler.call(client.generate, "q"), "answer")
+        self.assertEqual(len(client.calls), 3)
+
+    def test_gives_up_after_max_retries(self):
+        client = FakeClient(*[FakeAPIError(500)] * 10)
+        scheduler = make_scheduler(self.clock, max_retries=2)
+
+        with self.assertRaises(FakeAPIError):
+            scheduler.call(client.generate, "q")
+        self.assertEqual(len(client.calls), 3)
+
+    def test_bad_requests_are_not_retried(self):
+        client = FakeClient(FakeAPIError(400))
+        scheduler = make_scheduler(self.clock)
+
+        with self.assertRaises(FakeAPIError):
+            scheduler.call(client.generate, "q")
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(scheduler.stats()['circuit'], 'closed')
+
+    def test_async_retries_use_the_injected_sleep(self):
+        client = FakeClient(FakeAPIError(503), "answer")
+        scheduler = make_scheduler(self.clock)
+
+        result = asyncio.run(scheduler.call_async(client.generate_async, "q"))
+        self.assertEqual(result, "answer")
+        self.assertEqual(self.clock.slept, [1.0])
+
+
+class RateLimitTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_waits_for_tokens_on_the_fake_clock(self):
+        client = FakeClient()
+        scheduler = make_scheduler(self.clock, requests_per_minute=60, burst=2)
+
+        for i in range(5):
+            scheduler.call(client.generate, i)
+        self.assertEqual(len(client.calls), 5)
+        # Two calls from the burst, then one token per second
+        self.assertAlmostEqual(self.clock.now, 3.0)
+
+    def test_429_halves_the_rate_and_success_recovers_it(self):
+        scheduler = make_scheduler(self.clock, requests_per_minute=60, max_retries=0)
+
+        with self.assertRaises(FakeAPIError):
+            scheduler.call(FakeClient(FakeAPIError(429)).generate, "q")
+        self.assertAlmostEqual(scheduler.stats()['rate_per_minute'], 30.0)
+
+        # Additive recovery: a twentieth of the configured rate per success
+        scheduler.call(FakeClient("ok").generate, "q")
+        self.assertAlmostEqual(scheduler.stats()['rate_per_minute'], 33.0)
+
+    def test_429_is_retried_at_the_lower_rate(self):
+        client = FakeClient(FakeAPIError(429), "answer")
+        scheduler = make_scheduler(self.clock, requests_per_minute=60)
+
+        self.assertEqual(scheduler.call(client.generate, "q"), "answer")
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual(scheduler.stats()['retries'], 1)
+
+    def test_rate_never_drops_below_the_floor(self):
+        scheduler = make_scheduler(self.clock, requests_per_minute=60, max_retries=0,
+                                   failure_threshold=100)
+        for _ in range(10):
+            with self.assertRaises(FakeAPIError):
+                scheduler.call(FakeClient(FakeAPIError(429)).generate, "q")
+        self.assertAlmostEqual(scheduler.stats()['rate_per_minute'], 60 / 16)
+
+
+class CircuitBreakerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = make_scheduler(self.clock, max_retries=0, failure_threshold=2,
+                                        reset_timeout=30.0)
+
+    def open_circuit(self):
+        for _ in range(2):
+            with self.assertRaises(FakeAPIError):
+                self.scheduler.call(FakeClient(FakeAPIError(503)).generate, "q")
+        self.assertEqual(self.scheduler.stats()['circuit'], 'open')
+
+    def test_open_circuit_fails_fast_without_calling_the_client(self):
+        self.open_circuit()
+        client = FakeClient()
+
+        with self.assertRaises(CircuitOpenError):
+            self.scheduler.call(client.generate, "q")
+        self.assertEqual(client.calls, [])
+
+    def test_successful_probe_closes_the_circuit(self):
+        self.open_circuit()
+        self.clock.sleep(30.0)
+
+        self.assertEqual(self.scheduler.call(FakeClient("probe").generate, "q"), "probe")
+        self.assertEqual(self.scheduler.stats()['circuit'], 'closed')
+
+    def test_failed_probe_opens_the_circuit_again(self):
+        self.open_circuit()
+        self.clock.sleep(30.0)
+
+        with self.assertRaises(FakeAPIError):
+            self.scheduler.call(FakeClient(FakeAPIError(503)).generate, "q")
+        self.assertEqual(self.scheduler.stats()['circuit'], 'open')
+        with self.assertRaises(CircuitOpenError):
+            self.scheduler.call(FakeClient().generate, "q")
+
+    def test_half_open_lets_one_probe_through(self):
+        self.open_circuit()
+        self.clock.sleep(30.0)
+        breaker = self.scheduler.breaker
+
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, 'half_open')
+        self.assertFalse(breaker.allow())
+
+    def test_cancelled_probe_frees_the_half_open_slot(self):
+        self.open_circuit()
+        self.clock.sleep(30.0)
+
+        async def hang(prompt):
+            await asyncio.Event().wait()
+
+        async def cancel_probe():
+            task = asyncio.create_task(self.scheduler.call_async(hang, "q"))
+            await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_probe())
+        self.assertEqual(self.scheduler.call(FakeClient("ok").generate, "q"), "ok")
+        self.assertEqual(self.scheduler.stats()['circuit'], 'closed')
+
+    def test_bugs_in_our_code_do_not_close_an_open_circuit(self):
+        self.open_circuit()
+        self.clock.sleep(30.0)
+
+        with self.assertRaises(KeyError):
+            self.scheduler.call(FakeClient(KeyError("x")).generate, "q")
+        self.assertEqual(self.scheduler.stats()['circuit'], 'half_open')
+        # The probe slot was released, so a real request can still probe
+        self.assertEqual(self.scheduler.call(FakeClient("ok").generate, "q"), "ok")
+        self.assertEqual(self.scheduler.stats()['circuit'], 'closed')
+
+
+class PriorityTests(unittest.TestCase):
+
+    def test_interactive_requests_overtake_queued_background_ones(self):
+        clock = FakeClock()
+        scheduler = make_scheduler(clock, requests_per_minute=60, burst=1)
+        order = []
+
+        async def request(name, priority):
+            async def generate(prompt):
+                order.append(prompt)
+                return prompt
+            with use_priority(priority):
+                return await scheduler.call_async(generate, name)
+
+        async def main():
+            # Use up the burst so everything below has to queue
+            await request("warmup", INTERACTIVE)
+            await asyncio.gather(
+                request("background 1", BACKGROUND),
+                request("background 2", BACKGROUND),
+                request("interactive", INTERACTIVE),
+            )
+
+        asyncio.run(main())
+        self.assertEqual(order, ["warmup", "interactive", "background 1", "background 2"])
+
+
+if __name__ == '__main__':
+    unittest.main()